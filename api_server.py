@@ -1,7 +1,9 @@
+import hashlib
 import os
+import shutil
 import sys
 import tempfile
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, Response, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 import uuid
 import requests
@@ -13,7 +15,19 @@ import importlib.util
 sys.path.append('./scripts')
 
 # Import the video processing function from the renamed file (with underscore)
-from scripts.process_video import process_video
+from process_video import process_video, transcribe_video, build_caption_chunks
+from model_registry import is_available, preload_models, model_status
+import jobs
+import broll
+import transcript_cache
+import edit_plan
+import plan_format
+import output_store
+import core_budget
+from subtitles import SUBTITLE_FORMATS, to_subtitles
+from ffmpeg_render import probe_size
+from render_profiles import PROFILES
+from metrics import render_prometheus, span, trace
 
 # Load environment variables (continue even if .env file doesn't exist)
 try:
@@ -22,13 +36,71 @@ try:
 except Exception as e:
     print(f"Note: Could not load .env file: {e}. Using system environment variables.")
 
+class HashingFile:
+    """Upload target that hashes what is written to it.
+
+    Lives in the upload folder so save_upload can move it into place
+    instead of copying it; removed on close unless it was moved.
+    """
+
+    def __init__(self, directory):
+        fd, self.name = tempfile.mkstemp(dir=directory, suffix='-upload')
+        self.file = os.fdopen(fd, 'w+b')
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def move_to(self, path):
+        """Move the upload to path and return its sha256 hex digest"""
+        self.file.flush()
+        shutil.move(self.name, path)
+        return self.digest.hexdigest()
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.name)
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+class UploadRequest(Request):
+    """Request that writes and hashes file uploads as the body is parsed,
+    rather than spooling them to a temporary file for save_upload to copy"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uploads = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        upload = HashingFile(app.config['UPLOAD_FOLDER'])
+        self.uploads.append(upload)
+        return upload
+
+    def close(self):
+        super().close()
+        # Also parts the parser gave up on, which never made it into request.files
+        for upload in self.uploads:
+            upload.close()
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+
+# Load Whisper models once per process. With gunicorn --preload this runs in the
+# master, so forked workers share the model weights copy-on-write.
+preload_models()
 
 # Configure upload settings
 UPLOAD_FOLDER = tempfile.gettempdir()
 ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm'}
+RENDER_BACKENDS = {'moviepy', 'ffmpeg'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -41,59 +113,437 @@ def health_check():
         'environment': {
             'API_KEY_SET': bool(os.environ.get('PEXELS_API_KEY')),
             'MAX_BROLLS': os.environ.get('MAX_BROLLS', '5'),
-            'WHISPER_MODEL': os.environ.get('WHISPER_MODEL', 'base')
-        }
+            'WHISPER_MODEL': os.environ.get('WHISPER_MODEL', 'base'),
+            'RENDER_BACKEND': os.environ.get('RENDER_BACKEND', 'moviepy')
+        },
+        'models': model_status(),
+        'jobs': jobs.queue_status(),
+        'broll_cache': broll.cache_stats(),
+        'transcript_cache': transcript_cache.cache_stats(),
+        'output_store': output_store.cache_stats(),
+        'cores': core_budget.budget_status()
     }), 200
 
-@app.route('/process', methods=['POST'])
-def process_video_endpoint():
-    """Process a video file and return the processed video"""
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics: stage latency histograms and job queue gauges"""
+    jobs.expire_stale_jobs()
+    counts = jobs.job_counts()
+    queued = counts.get('uploading', 0) + counts.get('queued', 0)
+    running = counts.get('running', 0)
+    body = render_prometheus({
+        'video_jobs_queued': ('Jobs waiting for a worker', queued),
+        'video_jobs_running': ('Jobs being processed', running),
+        'video_jobs_in_flight': ('Jobs queued or running', queued + running),
+        'video_cores_total': ('Cores the scheduler hands out to jobs', core_budget.CPU_CORES),
+        'video_cores_reserved': ('Cores currently reserved by transcription and encoding', core_budget.reserved_cores()),
+    })
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+def validate_upload():
+    """Return (file, None) for a valid upload or (None, error response)"""
     # Check if a file was uploaded
     if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
+        return None, (jsonify({'error': 'No file part'}), 400)
     
     file = request.files['file']
     
     # Check if file is valid
     if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+        return None, (jsonify({'error': 'No selected file'}), 400)
     
     if not allowed_file(file.filename):
-        return jsonify({'error': f'File type not allowed. Supported types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
-    
+        return None, (jsonify({'error': f'File type not allowed. Supported types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400)
+
+    return file, None
+
+def processing_options():
+    """Return (options, None) from the request form or (None, error response)"""
+    options = {}
+
+    # Optional per-request Whisper model size
+    model_name = request.form.get('whisper_model') or None
+    if model_name and not is_available(model_name):
+        return None, (jsonify({'error': f'Unknown Whisper model: {model_name}'}), 400)
+    options['model_name'] = model_name
+
+    # Optional renderer override ('moviepy' or 'ffmpeg')
+    render_backend = request.form.get('render_backend') or None
+    if render_backend and render_backend not in RENDER_BACKENDS:
+        return None, (jsonify({'error': f'Unknown render backend: {render_backend}'}), 400)
+    options['render_backend'] = render_backend
+
+    # Optional encoding profile (fast, balanced or archival)
+    render_profile = request.form.get('render_profile') or None
+    if render_profile and render_profile not in PROFILES:
+        return None, (jsonify({'error': f'Unknown render profile: {render_profile}'}), 400)
+    options['render_profile'] = render_profile
+
+    # Optional number of time ranges to render in parallel
+    segments = request.form.get('render_segments')
+    if segments:
+        if not segments.isdigit() or int(segments) < 1:
+            return None, (jsonify({'error': 'render_segments must be a positive integer'}), 400)
+        options['segments'] = int(segments)
+
+    # Captions only: soft subtitle track, no B-roll and no re-encode
+    if request.form.get('captions_only', '').lower() in ('1', 'true', 'yes'):
+        options['captions_only'] = True
+
+    return options, None
+
+@app.route('/process', methods=['POST'])
+def process_video_endpoint():
+    """Process a video file and return the processed video"""
+    file, error = validate_upload()
+    if error:
+        return error
+
+    options, error = processing_options()
+    if error:
+        return error
+
+    # Create random ID for temp files
+    temp_id = str(uuid.uuid4())
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{temp_id}-input.mp4")
+    output_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{temp_id}-output.mp4")
+    download_name = f"processed-{secure_filename(file.filename)}"
+
+    with trace(temp_id):
+        try:
+            # Save the uploaded file, hashing it on the way
+            with span('upload'):
+                digest = save_upload(file, input_path)
+
+            # Identical input and settings: serve the stored output
+            result_id = output_store.output_id(digest, options)
+            stored_path = output_store.get_output(result_id)
+            if stored_path is None:
+                # Process the video
+                _, complete = process_video(input_path, output_path, **options)
+                if complete:
+                    stored_path = output_store.put_output(result_id, output_path)
+                else:
+                    # Missing b-roll a later run may find: send it, don't store it
+                    return send_file(output_path, mimetype='video/mp4', as_attachment=True,
+                                     download_name=download_name)
+            else:
+                print(f"Serving stored output {result_id}")
+
+            # Return the processed video file
+            return send_output(result_id, stored_path, download_name)
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+        finally:
+            # Clean up temp files; the output now lives in the store
+            with span('cleanup'):
+                for path in [input_path, output_path]:
+                    try:
+                        if os.path.exists(path):
+                            os.remove(path)
+                    except Exception as e:
+                        print(f"Failed to remove temp file {path}: {e}")
+
+def save_upload(file, path):
+    """Move an upload to path and return its sha256 hex digest"""
+    if isinstance(file.stream, HashingFile):
+        return file.stream.move_to(path)
+    # Not parsed by UploadRequest: copy it in chunks
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while True:
+            chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def send_output(result_id, path, download_name):
+    """Send a stored output with Range and conditional request support.
+
+    The ETag hashes the stored bytes, so If-Range resumes never splice a
+    re-rendered output onto an older download of the same id.
+    """
+    response = send_file(
+        path,
+        mimetype='video/mp4',
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=output_store.output_etag(result_id, path)
+    )
+    response.headers['X-Output-Id'] = result_id
+    response.headers['X-Output-Url'] = f"/outputs/{result_id}"
+    return response
+
+@app.route('/outputs/<result_id>', methods=['GET'])
+def output_endpoint(result_id):
+    """Download a stored output again; supports Range requests for resuming and seeking"""
+    path = output_store.get_output(result_id) if output_store.is_output_id(result_id) else None
+    if path is None:
+        return jsonify({'error': 'Output not found or expired'}), 404
     try:
-        # Create random ID for temp files
-        temp_id = str(uuid.uuid4())
-        
-        # Save the uploaded file
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{temp_id}-input.mp4")
-        file.save(input_path)
-        
-        # Define output path
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{temp_id}-output.mp4")
-        
-        # Process the video
-        process_video(input_path, output_path)
-        
-        # Return the processed video file
-        return send_file(
-            output_path,
-            mimetype='video/mp4',
-            as_attachment=True,
-            download_name=f"processed-{secure_filename(file.filename)}"
-        )
-        
+        return send_output(result_id, path, f"processed-{result_id[:12]}.mp4")
+    except FileNotFoundError:
+        # Evicted between the lookup and opening it
+        return jsonify({'error': 'Output not found or expired'}), 404
+
+@app.route('/jobs', methods=['POST'])
+def create_job_endpoint():
+    """Queue a video for background processing and return its job id"""
+    file, error = validate_upload()
+    if error:
+        return error
+
+    options, error = processing_options()
+    if error:
+        return error
+
+    try:
+        job_id = jobs.create_job()
+    except jobs.QueueFullError as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '30'}
+
+    try:
+        with span('upload'):
+            save_upload(file, jobs.input_path(job_id))
+        jobs.write_status(job_id, filename=secure_filename(file.filename))
+        jobs.submit_job(job_id, **options)
+    except Exception as e:
+        jobs.abandon_job(job_id)
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'id': job_id,
+        'status_url': f"/jobs/{job_id}",
+        'result_url': f"/jobs/{job_id}/result"
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status_endpoint(job_id):
+    """Report a job's state, stage and progress"""
+    status = jobs.read_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result_endpoint(job_id):
+    """Stream the processed video of a finished job"""
+    status = jobs.read_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if status.get('state') == 'failed':
+        return jsonify({'error': status.get('error', 'Job failed')}), 500
+    if status.get('state') != 'done':
+        return jsonify({'error': 'Job not finished', 'state': status.get('state')}), 409
+
+    return send_file(
+        jobs.output_path(job_id),
+        mimetype='video/mp4',
+        as_attachment=True,
+        download_name=f"processed-{status.get('filename') or 'video.mp4'}",
+        conditional=True
+    )
+
+@app.route('/captions', methods=['POST'])
+def captions_endpoint():
+    """Transcribe a video and return only the subtitle file (srt, vtt or ass)"""
+    file, error = validate_upload()
+    if error:
+        return error
+
+    options, error = processing_options()
+    if error:
+        return error
+
+    subtitle_format = request.form.get('format', 'srt').lower()
+    if subtitle_format not in SUBTITLE_FORMATS:
+        return jsonify({'error': f'Unknown subtitle format. Supported: {", ".join(SUBTITLE_FORMATS)}'}), 400
+
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}-input.mp4")
+    try:
+        save_upload(file, input_path)
+        result = transcribe_video(input_path, options['model_name'])
+        caption_chunks = build_caption_chunks(result)
+        width, height = probe_size(input_path) if subtitle_format == 'ass' else (1920, 1080)
+        document = to_subtitles(caption_chunks, subtitle_format, width, height)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    
     finally:
-        # Clean up temp files
-        for path in [input_path, output_path]:
-            try:
-                if os.path.exists(path):
-                    os.remove(path)
-            except Exception as e:
-                print(f"Failed to remove temp file {path}: {e}")
+        if os.path.exists(input_path):
+            os.remove(input_path)
+
+    name = os.path.splitext(secure_filename(file.filename))[0] or 'captions'
+    return Response(document, mimetype=SUBTITLE_FORMATS[subtitle_format], headers={
+        'Content-Disposition': f'attachment; filename="{name}.{subtitle_format}"'
+    })
+
+def analyze_upload():
+    """Return (plan, None) for an upload analyzed into a new stored plan or (None, error response)"""
+    file, error = validate_upload()
+    if error:
+        return None, error
+
+    options, error = processing_options()
+    if error:
+        return None, error
+
+    plan_id = edit_plan.create_plan_dir()
+    try:
+        source_path = edit_plan.plan_file(plan_id, 'source.mp4')
+        save_upload(file, source_path)
+        plan = edit_plan.analyze(source_path, model_name=options['model_name'],
+                                 render_profile=options['render_profile'])
+        plan['id'] = plan_id
+        edit_plan.save_json(plan_id, 'plan.json', plan)
+    except Exception as e:
+        shutil.rmtree(edit_plan.plan_dir(plan_id), ignore_errors=True)
+        return None, (jsonify({'error': str(e)}), 500)
+
+    return plan, None
+
+@app.route('/analyze', methods=['POST'])
+def analyze_endpoint():
+    """Transcribe a video and return an editable plan without rendering it"""
+    plan, error = analyze_upload()
+    if error:
+        return error
+
+    return jsonify(plan), 200
+
+@app.route('/preview', methods=['POST'])
+def preview_endpoint():
+    """Analyze a video and return a quick low-resolution preview of the result.
+
+    The plan is kept: its id is returned in the X-Plan-Id header, and the
+    full-quality render is only spent once /plans/<id>/render is called.
+    """
+    plan, error = analyze_upload()
+    if error:
+        return error
+
+    plan_id = plan['id']
+    try:
+        edit_plan.render_preview(plan, edit_plan.plan_file(plan_id, 'source.mp4'),
+                                 edit_plan.plan_file(plan_id, 'preview.mp4'))
+    except Exception as e:
+        shutil.rmtree(edit_plan.plan_dir(plan_id), ignore_errors=True)
+        return jsonify({'error': str(e)}), 500
+
+    return send_preview(plan_id)
+
+def edited_plan(plan_id, render_profile=None):
+    """Return (plan, None) for a stored plan or (None, error response).
+
+    An edited plan posted as the JSON body replaces the stored one, and
+    ``render_profile`` overrides its profile. The result is validated and
+    saved as the plan's latest version.
+    """
+    plan = edit_plan.load_json(plan_id, 'plan.json')
+    if plan is None:
+        return None, (jsonify({'error': 'Plan not found'}), 404)
+
+    edited = request.get_json(silent=True)
+    if edited is not None:
+        if not isinstance(edited, dict):
+            return None, (jsonify({'error': 'Plan must be a JSON object'}), 400)
+        # The source describes the stored video; sizes are validated against it
+        if edited.get('source') != plan.get('source'):
+            return None, (jsonify({'error': "Plan 'source' doesn't match the analyzed video"}), 400)
+        plan = edited
+    plan['id'] = plan_id
+    if render_profile and isinstance(plan.get('settings'), dict):
+        plan['settings']['render_profile'] = render_profile
+
+    try:
+        plan_format.validate_plan(plan)
+    except plan_format.PlanError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    edit_plan.save_json(plan_id, 'plan.json', plan)
+    return plan, None
+
+@app.route('/plans/<plan_id>', methods=['GET'])
+def plan_endpoint(plan_id):
+    """Return the latest version of a plan"""
+    plan = edit_plan.load_json(plan_id, 'plan.json')
+    if plan is None:
+        return jsonify({'error': 'Plan not found'}), 404
+    return jsonify(plan), 200
+
+@app.route('/plans/<plan_id>/render', methods=['POST'])
+def render_plan_endpoint(plan_id):
+    """Render a plan, optionally replacing it with an edited version from the body.
+
+    When the plan was rendered before, only the time ranges whose captions or
+    b-roll changed are re-encoded and spliced into the previous output.
+    """
+    render_backend = request.args.get('render_backend') or None
+    if render_backend and render_backend not in RENDER_BACKENDS:
+        return jsonify({'error': f'Unknown render backend: {render_backend}'}), 400
+
+    plan, error = edited_plan(plan_id, render_profile=request.args.get('render_profile'))
+    if error:
+        return error
+
+    output_path = edit_plan.plan_file(plan_id, 'output.mp4')
+    next_output_path = edit_plan.plan_file(plan_id, f"output-{uuid.uuid4()}.mp4")
+    try:
+        backend = edit_plan.render_plan(
+            plan,
+            edit_plan.plan_file(plan_id, 'source.mp4'),
+            next_output_path,
+            previous_plan=edit_plan.load_json(plan_id, 'rendered.json'),
+            previous_output=output_path,
+            backend=render_backend
+        )
+        os.replace(next_output_path, output_path)
+        # Later renders only splice in ranges drawn by the same backend
+        edit_plan.save_json(plan_id, 'rendered.json',
+                            dict(plan, settings=dict(plan.get('settings') or {}, render_backend=backend)))
+    except Exception as e:
+        if os.path.exists(next_output_path):
+            os.remove(next_output_path)
+        return jsonify({'error': str(e)}), 500
+
+    return send_file(
+        output_path,
+        mimetype='video/mp4',
+        as_attachment=True,
+        download_name=f"processed-{plan_id}.mp4",
+        conditional=True
+    )
+
+@app.route('/plans/<plan_id>/preview', methods=['POST'])
+def preview_plan_endpoint(plan_id):
+    """Render a low-resolution preview of a plan, optionally edited in the body"""
+    plan, error = edited_plan(plan_id)
+    if error:
+        return error
+
+    preview_path = edit_plan.plan_file(plan_id, f"preview-{uuid.uuid4()}.mp4")
+    try:
+        edit_plan.render_preview(plan, edit_plan.plan_file(plan_id, 'source.mp4'), preview_path)
+        os.replace(preview_path, edit_plan.plan_file(plan_id, 'preview.mp4'))
+    except Exception as e:
+        if os.path.exists(preview_path):
+            os.remove(preview_path)
+        return jsonify({'error': str(e)}), 500
+
+    return send_preview(plan_id)
+
+def send_preview(plan_id):
+    response = send_file(
+        edit_plan.plan_file(plan_id, 'preview.mp4'),
+        mimetype='video/mp4',
+        download_name=f"preview-{plan_id}.mp4",
+        conditional=True
+    )
+    response.headers['X-Plan-Id'] = plan_id
+    return response
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8000))
@@ -0,0 +1,66 @@
+"""Compare ImageMagick TextClip captions with the in-process Pillow renderer.
+
+Usage: python benchmarks/bench_captions.py [video_path] [--whisper-model tiny]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from moviepy.editor import TextClip
+from model_registry import get_model
+from process_video import build_caption_chunks
+import captions
+
+
+def time_it(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f}s")
+    return elapsed
+
+
+def textclip_path(texts):
+    for text in texts:
+        TextClip(text.strip(), fontsize=50, color='white', font="Arial-Bold",
+                 stroke_color='black', stroke_width=2).close()
+
+
+def pillow_path(texts):
+    for text in texts:
+        captions.render_caption(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('video', nargs='?', default=os.path.join('public', 'pitch.mp4'))
+    parser.add_argument('--whisper-model', default='tiny')
+    parser.add_argument('--skip-textclip', action='store_true', help="Skip the ImageMagick baseline")
+    args = parser.parse_args()
+
+    print(f"Transcribing {args.video} with Whisper '{args.whisper_model}'...")
+    result = get_model(args.whisper_model).transcribe(args.video, word_timestamps=True)
+    texts = [text for text, _, _ in build_caption_chunks(result)]
+    print(f"{len(texts)} caption chunks, {len(set(t.strip() for t in texts))} unique\n")
+
+    if not args.skip_textclip:
+        baseline = time_it("TextClip (ImageMagick)", lambda: textclip_path(texts))
+    cold = time_it("Pillow, cold cache", lambda: pillow_path(texts))
+    warm = time_it("Pillow, warm cache", lambda: pillow_path(texts))
+    captions._render_caption.cache_clear()
+    parallel = time_it(f"Pillow, {captions.CAPTION_RENDER_THREADS} threads",
+                       lambda: captions.prerender_captions(texts))
+
+    print()
+    if not args.skip_textclip:
+        print(f"Speedup (cold):     {baseline / cold:8.1f}x")
+        print(f"Speedup (parallel): {baseline / parallel:8.1f}x")
+    print(f"Cache: {captions.cache_info()}")
+    print(f"Warm cache time per chunk: {1e6 * warm / max(len(texts), 1):.1f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Exercise the shared Pexels client against the local stand-in server.
+
+Several processes, each with several threads, resolve the same search terms
+at once, like concurrent jobs would. The report compares requests made
+with requests the server actually served, and shows the client's counters
+for coalesced requests, throttling and retries.
+
+Usage: python benchmarks/bench_pexels_client.py [--processes 4] [--threads 4] [--terms 10]
+           [--rate 5] [--latency 0.2] [--throttle-every 7]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'scripts'))
+
+from pexels_stub import start_server
+
+TERMS = ['city skyline', 'modern office', 'tropical beach', 'forest trees', 'ocean waves', 'cute dog',
+         'people working', 'cooking kitchen', 'mountain landscape', 'coffee cafe', 'library books',
+         'green park', 'art museum', 'shopping mall', 'blue sky', 'bird flying']
+
+
+def worker(terms, threads):
+    import broll
+
+    def resolve(term):
+        photo = broll.search_photo(term)
+        broll.load_overlay(broll.choose_variant(photo, 480), 480)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(resolve, terms * 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--terms', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=5, help="Searches per second for the token bucket")
+    parser.add_argument('--burst', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds the fake server takes per response")
+    parser.add_argument('--throttle-every', type=int, default=0, help="Server answers every Nth search with 429")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='pexels-bench-')
+    server, url = start_server(latency=args.latency, throttle_every=args.throttle_every)
+    os.environ.update({
+        'PEXELS_API_KEY': 'benchmark',
+        'PEXELS_API_URL': url,
+        'BROLL_CACHE_DIR': work_dir,
+        'PEXELS_RATE_PER_SECOND': str(args.rate),
+        'PEXELS_BURST': str(args.burst),
+    })
+    try:
+        terms = TERMS[:args.terms]
+        start = time.perf_counter()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=worker, args=(terms, args.threads)) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        import broll
+        served = requests.get(url.replace('/v1/search', '/stats')).json()
+        attempted = args.processes * len(terms) * 2
+        print(f"{attempted} lookups of {len(terms)} terms in {elapsed:.2f}s")
+        print(f"Server saw: {json.dumps(served)}")
+        print(f"Client counters: {json.dumps(broll.client.stats())}")
+        print(f"Search cache: {json.dumps(broll.search_cache.stats())}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
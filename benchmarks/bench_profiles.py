@@ -0,0 +1,62 @@
+"""Compare render profiles: encoding speed and output size.
+
+Captions are synthetic (one every second) so the benchmark needs neither
+Whisper nor Pexels, and only the rendering and encoding are measured.
+
+Usage: python benchmarks/bench_profiles.py [video_path ...] [--backend moviepy|ffmpeg] [--profiles fast,balanced]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from moviepy.editor import VideoFileClip
+from process_video import render_video
+from render_profiles import PROFILES
+
+
+def synthetic_captions(duration):
+    return [(f"caption number {i}", float(i), min(i + 0.9, duration)) for i in range(int(duration))]
+
+
+def bench(video_path, profile, backend, segments):
+    video = VideoFileClip(video_path)
+    fd, output_path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        render_video(video, video_path, output_path, synthetic_captions(video.duration), [],
+                     backend=backend, segments=segments, profile=profile)
+        elapsed = time.perf_counter() - start
+        frames = video.duration * video.fps
+        return elapsed, frames / elapsed, os.path.getsize(output_path)
+    finally:
+        video.close()
+        os.unlink(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('videos', nargs='*', default=['test.mp4', os.path.join('public', 'pitch.mp4')])
+    parser.add_argument('--backend', default='ffmpeg', choices=['moviepy', 'ffmpeg'])
+    parser.add_argument('--profiles', default=','.join(PROFILES))
+    parser.add_argument('--segments', type=int, default=1, help="Parallel MoviePy segments (1 renders in one piece)")
+    args = parser.parse_args()
+
+    print(f"{'video':<24} {'profile':<10} {'seconds':>8} {'fps':>8} {'size MB':>8}")
+    for video_path in args.videos:
+        if not os.path.exists(video_path):
+            print(f"Skipping missing {video_path}")
+            continue
+        source_mb = os.path.getsize(video_path) / 1e6
+        for profile in args.profiles.split(','):
+            elapsed, fps, size = bench(video_path, profile, args.backend, args.segments)
+            print(f"{os.path.basename(video_path):<24} {profile:<10} {elapsed:8.2f} {fps:8.1f} {size / 1e6:8.2f}")
+        print(f"{os.path.basename(video_path):<24} {'(source)':<10} {'':>8} {'':>8} {source_mb:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
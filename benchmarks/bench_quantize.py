@@ -0,0 +1,78 @@
+"""Compare fp32 and int8-quantized Whisper on CPU: speed and word error rate.
+
+The fp32 transcript is the reference, so the WER is how much quantization
+changes the output rather than an absolute accuracy.
+
+Usage: python benchmarks/bench_quantize.py [video_path ...] [--whisper-model base] [--threads 4] [--runs 2]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import torch
+from audio import SAMPLE_RATE, load_audio
+from model_registry import get_model
+
+DEFAULT_VIDEOS = ['test.mp4', os.path.join('public', 'temp', 'test.mp4'), os.path.join('public', 'pitch.mp4')]
+
+
+def normalize(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance divided by the reference length"""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / max(len(ref), 1)
+
+
+def time_transcribe(model, audio, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = model.transcribe(audio, word_timestamps=True, fp16=False)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result['text']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('videos', nargs='*', default=DEFAULT_VIDEOS)
+    parser.add_argument('--whisper-model', default='base')
+    parser.add_argument('--threads', type=int, default=0, help="torch intra-op threads (0 keeps the default)")
+    parser.add_argument('--runs', type=int, default=2)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    print(f"torch threads: {torch.get_num_threads()}")
+    fp32 = get_model(f"{args.whisper_model}:fp32")
+    int8 = get_model(f"{args.whisper_model}:int8")
+
+    print(f"\n{'video':<24} {'audio s':>8} {'fp32 s':>8} {'int8 s':>8} {'speedup':>8} {'WER':>7}")
+    for video_path in args.videos:
+        if not os.path.exists(video_path):
+            print(f"Skipping missing {video_path}")
+            continue
+        audio = load_audio(video_path)
+        fp32_seconds, reference = time_transcribe(fp32, audio, args.runs)
+        int8_seconds, hypothesis = time_transcribe(int8, audio, args.runs)
+        print(f"{video_path:<24} {len(audio) / SAMPLE_RATE:8.1f} {fp32_seconds:8.2f} "
+              f"{int8_seconds:8.2f} {fp32_seconds / int8_seconds:7.2f}x "
+              f"{word_error_rate(reference, hypothesis):6.1%}")
+
+
+if __name__ == '__main__':
+    main()
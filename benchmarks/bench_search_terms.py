@@ -0,0 +1,88 @@
+"""Micro-benchmark find_search_term: legacy substring scan vs the phrase index.
+
+Usage: python benchmarks/bench_search_terms.py [--chunks 5000] [--vocab 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from search_terms import SEARCH_TERMS, SearchTermIndex
+
+
+def legacy_find(search_terms, text):
+    """The original find_search_term: a substring test per key"""
+    text = text.lower().strip()
+    for terms in search_terms.values():
+        for key, value in terms.items():
+            if key.lower() in text:
+                return value
+    return text
+
+
+def synthetic_vocabulary(size, rng):
+    """Grow the real vocabulary with random made-up one and two word terms"""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    terms = dict(SEARCH_TERMS)
+    extra = {}
+    while len(extra) < size:
+        words = [''.join(rng.choice(letters) for _ in range(rng.randint(4, 9)))
+                 for _ in range(rng.randint(1, 2))]
+        extra[' '.join(words)] = f"{words[0]} photo"
+    terms['synthetic'] = extra
+    return terms
+
+
+def caption_chunks(search_terms, count, rng):
+    """Three word chunks mixing vocabulary keys with filler words"""
+    keys = [key for terms in search_terms.values() for key in terms]
+    filler = ['the', 'and', 'we', 'really', 'about', 'going', 'to', 'so', 'just', 'think']
+    chunks = []
+    for _ in range(count):
+        words = [rng.choice(filler) for _ in range(3)]
+        if rng.random() < 0.5:
+            words[rng.randrange(3)] = rng.choice(keys)
+        chunks.append(' '.join(words))
+    return chunks
+
+
+def bench(label, fn, chunks):
+    start = time.perf_counter()
+    fn(chunks)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:8.4f}s  {1e6 * elapsed / len(chunks):8.2f}us/chunk")
+    return elapsed
+
+
+def run(search_terms, chunks, label):
+    vocab_size = sum(len(terms) for terms in search_terms.values())
+    print(f"\n{label}: {vocab_size} terms, {len(chunks)} chunks")
+
+    start = time.perf_counter()
+    index = SearchTermIndex(search_terms)
+    print(f"{'index build':<40} {time.perf_counter() - start:8.4f}s")
+
+    legacy = bench("legacy substring scan", lambda cs: [legacy_find(search_terms, c) for c in cs], chunks)
+    single = bench("index, one call per chunk", lambda cs: [index.match(c) for c in cs], chunks)
+    bench("index, batch match_all", index.match_all, chunks)
+    print(f"{'speedup':<40} {legacy / single:8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chunks', type=int, default=5000)
+    parser.add_argument('--vocab', type=int, default=20000, help="Synthetic vocabulary size")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    run(SEARCH_TERMS, caption_chunks(SEARCH_TERMS, args.chunks, rng), "search_terms.json")
+    large = synthetic_vocabulary(args.vocab, rng)
+    run(large, caption_chunks(large, args.chunks, rng), "synthetic vocabulary")
+
+
+if __name__ == '__main__':
+    main()
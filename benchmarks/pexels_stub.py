@@ -0,0 +1,158 @@
+"""A local stand-in for the Pexels search API serving generated fixture images.
+
+Searches always find one photo whose id is derived from the query, so runs
+are reproducible. Images are drawn with Pillow on first request and kept in
+memory. Point the pipeline at it with PEXELS_API_URL. ``/stats`` reports how
+many searches and image downloads were served, and ``--throttle-every``
+answers every Nth search with a 429 to exercise retries.
+
+Usage: python benchmarks/pexels_stub.py [--port 8765] [--latency 0.05] [--throttle-every 0]
+"""
+import argparse
+import functools
+import io
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageDraw
+
+PHOTO_COUNT = 40
+ORIGINAL_SIZE = (3000, 2000)
+# Same boxes as broll.PEXELS_VARIANTS: (name, max width, max height)
+VARIANTS = [
+    ('small', None, 130),
+    ('medium', None, 350),
+    ('large', 940, 650),
+    ('large2x', 1880, 1300),
+]
+
+
+def variant_size(name):
+    if name == 'original':
+        return ORIGINAL_SIZE
+    width, height = ORIGINAL_SIZE
+    _, box_width, box_height = next(v for v in VARIANTS if v[0] == name)
+    scale = min(box_width / width if box_width else 1.0, box_height / height if box_height else 1.0, 1.0)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+@functools.lru_cache(maxsize=256)
+def fixture_image(photo_id, variant):
+    """JPEG bytes of a deterministic gradient with a grid, unique per photo id"""
+    size = variant_size(variant)
+    hue = photo_id * 37 % 256
+    gradient = Image.linear_gradient('L').resize(size)
+    image = Image.merge('RGB', (gradient, gradient.point(lambda v: (v + hue) % 256),
+                                Image.new('L', size, hue)))
+    draw = ImageDraw.Draw(image)
+    step = max(size[0] // 12, 4)
+    for x in range(0, size[0], step):
+        draw.line([(x, 0), (x, size[1])], fill=(255, 255, 255), width=max(step // 20, 1))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class PexelsHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    throttle_every = 0
+    # Shared by all handler threads of a server
+    counts = None
+    counts_lock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def count(self, field):
+        with self.counts_lock:
+            self.counts[field] = self.counts.get(field, 0) + 1
+            return self.counts[field]
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/stats':
+            with self.counts_lock:
+                self.send_body(json.dumps(self.counts).encode(), 'application/json')
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if url.path == '/v1/search':
+            if self.throttle_every and self.count('search_attempts') % self.throttle_every == 0:
+                self.count('throttled')
+                self.send_response(429)
+                self.send_header('Retry-After', '1')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.count('searches')
+            query = parse_qs(url.query).get('query', [''])[0]
+            self.send_body(json.dumps(self.search(query)).encode(), 'application/json')
+        elif url.path.startswith('/photos/'):
+            self.count('images')
+            # /photos/<id>/<variant>.jpg
+            try:
+                _, _, photo_id, name = url.path.split('/')
+                body = fixture_image(int(photo_id), name[:-len('.jpg')])
+            except (ValueError, StopIteration):
+                self.send_error(404)
+                return
+            self.send_body(body, 'image/jpeg')
+        else:
+            self.send_error(404)
+
+    def search(self, query):
+        photo_id = zlib.crc32(query.encode()) % PHOTO_COUNT
+        host = f"http://{self.headers.get('Host')}"
+        width, height = ORIGINAL_SIZE
+        return {
+            'photos': [{
+                'id': photo_id,
+                'width': width,
+                'height': height,
+                'src': {name: f"{host}/photos/{photo_id}/{name}.jpg"
+                        for name in ['original'] + [v[0] for v in VARIANTS]},
+            }],
+        }
+
+
+def start_server(port=0, latency=0.0, throttle_every=0):
+    """Serve on a background thread; returns (server, search URL)"""
+    handler = type('Handler', (PexelsHandler,), {
+        'latency': latency,
+        'throttle_every': throttle_every,
+        'counts': {},
+        'counts_lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/search"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--throttle-every', type=int, default=0, help="Answer every Nth search with 429")
+    args = parser.parse_args()
+    server, url = start_server(args.port, args.latency, args.throttle_every)
+    print(f"Serving fake Pexels search at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""Benchmark process_video end to end without network access.
+
+B-roll comes from a local stand-in Pexels server (benchmarks/pexels_stub.py)
+and ``--whisper stub`` swaps in a deterministic fake model, so only our own
+code is measured. Each run happens in a fresh forked process with cold
+caches (unless ``--warm``). The report has throughput (source seconds per
+wall second), per-stage timings and peak memory, as JSON. Pass a baseline
+report to flag regressions; the exit status is 1 when there are any.
+Timings depend on the machine, so no baseline is committed: record one with
+``--output`` on the machine you compare on, before making changes.
+
+Usage: python benchmarks/run_pipeline.py [video_path ...] [--whisper stub|tiny|base] [--runs 3]
+           [--output report.json] [--baseline report.json] [--tolerance 0.15]
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'scripts'))
+
+from pexels_stub import start_server
+
+DEFAULT_VIDEOS = ['test.mp4', os.path.join('public', 'temp', 'test.mp4'), os.path.join('public', 'pitch.mp4')]
+# Stage changes smaller than this (in seconds) are noise, not regressions
+MIN_REGRESSION_SECONDS = 0.05
+# Words the stub model "hears"; the nouns give B-roll search terms to match
+STUB_WORDS = ['the', 'city', 'at', 'night', 'and', 'a', 'beach', 'with', 'people', 'we', 'walk',
+              'to', 'the', 'office', 'then', 'cook', 'in', 'a', 'cozy', 'home']
+
+
+class StubWhisperModel:
+    """Deterministic stand-in for a Whisper model: one word every 0.4 seconds"""
+
+    device = types.SimpleNamespace(type='cpu')
+
+    def transcribe(self, audio, **options):
+        from audio import SAMPLE_RATE
+
+        duration = len(audio) / SAMPLE_RATE
+        words = []
+        t = 0.2
+        while t + 0.3 < duration:
+            words.append({'word': ' ' + STUB_WORDS[len(words) % len(STUB_WORDS)],
+                          'start': round(t, 3), 'end': round(t + 0.3, 3)})
+            t += 0.4
+        segments = []
+        for i in range(0, len(words), 12):
+            segment_words = words[i:i + 12]
+            segments.append({
+                'id': len(segments),
+                'start': segment_words[0]['start'],
+                'end': segment_words[-1]['end'],
+                'text': ''.join(w['word'] for w in segment_words),
+                'words': segment_words,
+            })
+        return {'text': ''.join(s['text'] for s in segments), 'segments': segments, 'language': 'en'}
+
+
+def configure_environment(work_dir, pexels_url):
+    """Point every cache and the Pexels client at benchmark-only locations.
+
+    Must run before the pipeline modules are imported, since they read their
+    settings at import time.
+    """
+    os.environ.update({
+        'PEXELS_API_KEY': 'benchmark',
+        'PEXELS_API_URL': pexels_url,
+        'BROLL_CACHE_DIR': os.path.join(work_dir, 'broll-cache'),
+        'TRANSCRIPT_CACHE_DIR': os.path.join(work_dir, 'transcript-cache'),
+        'METRICS_DIR': os.path.join(work_dir, 'metrics'),
+        'CORE_SLOTS_DIR': os.path.join(work_dir, 'cores'),
+    })
+
+
+def clear_caches():
+    import broll
+    import transcript_cache
+
+    broll.search_cache.clear()
+    broll.image_cache.clear()
+    transcript_cache.cache.clear()
+
+
+def run_once(video_path, output_path, model_name, backend, profile, verbose):
+    """Process one video in this (forked) process and return its measurements"""
+    from metrics import trace
+    from process_video import process_video
+
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with log, trace(os.path.basename(video_path)) as spans:
+        process_video(video_path, output_path, model_name=model_name,
+                      render_backend=backend, render_profile=profile)
+    wall = time.perf_counter() - start
+
+    stages = {}
+    for span in spans:
+        if span['stage'] != 'job':
+            stages[span['stage']] = stages.get(span['stage'], 0.0) + span['wall_seconds']
+    # ru_maxrss is in kilobytes; children covers ffmpeg and worker pools
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        'wall_seconds': wall,
+        'stages': stages,
+        'peak_rss_mb': own / 1024,
+        'peak_child_rss_mb': children / 1024,
+        'output_bytes': os.path.getsize(output_path),
+    }
+
+
+def source_duration(video_path):
+    from ffmpeg_render import FFPROBE_BINARY
+
+    output = subprocess.run(
+        [FFPROBE_BINARY, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', video_path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip())
+
+
+def bench_video(video_path, args, work_dir):
+    duration = source_duration(video_path)
+    runs = []
+    for i in range(args.runs):
+        if not args.warm:
+            clear_caches()
+        output_path = os.path.join(work_dir, f"output-{i}.mp4")
+        # A fresh process per run so peak memory is per run, as in a job worker
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as pool:
+            runs.append(pool.submit(run_once, video_path, output_path, args.whisper,
+                                    args.backend, args.profile, args.verbose).result())
+        os.unlink(output_path)
+        print(f"  run {i + 1}: {runs[-1]['wall_seconds']:.2f}s", file=sys.stderr)
+
+    wall = statistics.median(r['wall_seconds'] for r in runs)
+    stage_names = sorted({stage for r in runs for stage in r['stages']})
+    return {
+        'source_seconds': round(duration, 3),
+        'runs': len(runs),
+        'wall_seconds': round(wall, 3),
+        'throughput': round(duration / wall, 3),
+        'stages': {
+            stage: round(statistics.median(r['stages'].get(stage, 0.0) for r in runs), 4)
+            for stage in stage_names
+        },
+        'peak_rss_mb': round(max(r['peak_rss_mb'] for r in runs), 1),
+        'peak_child_rss_mb': round(max(r['peak_child_rss_mb'] for r in runs), 1),
+        'output_bytes': runs[-1]['output_bytes'],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Print the changes against a baseline report and return the regressions"""
+    regressions = []
+    if baseline.get('meta', {}).get('settings') != report['meta']['settings']:
+        print("Warning: the baseline was recorded with different settings", file=sys.stderr)
+
+    for name, result in report['videos'].items():
+        base = baseline.get('videos', {}).get(name)
+        if not base:
+            continue
+        checks = [('throughput', base['throughput'], result['throughput'], False),
+                  ('peak_rss_mb', base['peak_rss_mb'], result['peak_rss_mb'], True)]
+        checks += [(f"stage {stage}", base['stages'][stage], seconds, True)
+                   for stage, seconds in result['stages'].items() if stage in base['stages']]
+        for label, old, new, lower_is_better in checks:
+            change = (new - old) / old if old else 0.0
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            if worse and label.startswith('stage') and new - old < MIN_REGRESSION_SECONDS:
+                worse = False
+            print(f"{name:<24} {label:<28} {old:10.3f} -> {new:10.3f} ({change:+.1%})"
+                  f"{'  REGRESSION' if worse else ''}", file=sys.stderr)
+            if worse:
+                regressions.append({'video': name, 'metric': label, 'baseline': old, 'current': new})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('videos', nargs='*', default=DEFAULT_VIDEOS)
+    parser.add_argument('--whisper', default='stub', help="'stub' or a Whisper model name such as tiny")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--backend', default='moviepy', choices=['moviepy', 'ffmpeg'])
+    parser.add_argument('--profile', default='balanced')
+    parser.add_argument('--warm', action='store_true', help="Keep caches between runs")
+    parser.add_argument('--pexels-latency', type=float, default=0.0, help="Seconds added to every fake Pexels response")
+    parser.add_argument('--output', help="Write the JSON report here (default stdout)")
+    parser.add_argument('--baseline', help="Baseline report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed relative slowdown")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='pipeline-bench-')
+    server, pexels_url = start_server(latency=args.pexels_latency)
+    configure_environment(work_dir, pexels_url)
+
+    from model_registry import get_model, register_model
+    if args.whisper == 'stub':
+        register_model('stub', StubWhisperModel())
+    # Load once in the parent so runs measure transcription, not model loading
+    get_model(args.whisper)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'settings': {
+                'whisper': args.whisper,
+                'backend': args.backend,
+                'profile': args.profile,
+                'warm': args.warm,
+                'pexels_latency': args.pexels_latency,
+            },
+        },
+        'videos': {},
+    }
+    try:
+        for video_path in args.videos:
+            if not os.path.exists(video_path):
+                print(f"Skipping missing {video_path}", file=sys.stderr)
+                continue
+            print(f"Benchmarking {video_path}", file=sys.stderr)
+            report['videos'][video_path] = bench_video(video_path, args, work_dir)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import subprocess
+import tempfile
+
+import numpy as np
+
+from ffmpeg_render import FFMPEG_BINARY
+
+# Whisper's expected input: 16 kHz mono float32
+SAMPLE_RATE = 16000
+READ_SIZE = 1024 * 1024
+
+
+def load_audio(path, sample_rate=SAMPLE_RATE):
+    """Decode a media file's audio to a mono float32 array in a single pass.
+
+    ffmpeg resamples and downmixes while decoding and streams raw PCM over a
+    pipe into the buffer, so no WAV is written and Whisper doesn't decode again.
+    """
+    cmd = [
+        FFMPEG_BINARY, '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-i', path,
+        '-vn', '-ac', '1', '-ar', str(sample_rate),
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        'pipe:1',
+    ]
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        # A bytearray keeps the samples writable, which torch.from_numpy wants
+        buffer = bytearray()
+        while True:
+            chunk = proc.stdout.read(READ_SIZE)
+            if not chunk:
+                break
+            buffer += chunk
+        returncode = proc.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"Failed to decode audio: {stderr.read().decode(errors='replace').strip()}")
+
+    # Drop a trailing partial sample, if any
+    usable = len(buffer) - len(buffer) % 4
+    return np.frombuffer(buffer, dtype=np.float32, count=usable // 4)
@@ -0,0 +1,234 @@
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+
+import numpy as np
+from PIL import Image
+
+from disk_cache import DiskCache
+from metrics import in_context, span
+from pexels_client import PexelsClient
+from search_terms import find_search_terms
+
+# Configure settings from environment variables with defaults
+MAX_BROLLS = int(os.environ.get('MAX_BROLLS', 5))
+API_KEY = os.environ.get('PEXELS_API_KEY')
+PEXELS_API_URL = os.environ.get('PEXELS_API_URL', 'https://api.pexels.com/v1/search')
+# Hosts b-roll images may be downloaded from: the Pexels CDN, and the API host
+# itself (a local stand-in for the API serves its images too)
+PEXELS_IMAGE_HOSTS = {'images.pexels.com', urlparse(PEXELS_API_URL).hostname}
+# Concurrent search/download requests per job
+BROLL_WORKERS = int(os.environ.get('BROLL_WORKERS', 4))
+# Timeout for a single HTTP request, in seconds
+BROLL_REQUEST_TIMEOUT = float(os.environ.get('BROLL_REQUEST_TIMEOUT', 10))
+# Overall time budget for resolving all b-rolls of a job, in seconds
+BROLL_DEADLINE = float(os.environ.get('BROLL_DEADLINE', 30))
+# Use every Nth caption chunk as a b-roll candidate
+BROLL_EVERY = int(os.environ.get('BROLL_EVERY', 5))
+# Shared on-disk cache of Pexels searches and downloaded images
+BROLL_CACHE_DIR = os.environ.get('BROLL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'broll-cache'))
+BROLL_CACHE_MAX_MB = int(os.environ.get('BROLL_CACHE_MAX_MB', 512))
+# How long search results stay fresh, in seconds
+BROLL_SEARCH_TTL = int(os.environ.get('BROLL_SEARCH_TTL', 7 * 24 * 3600))
+# Pexels searches allowed per second across all workers on this host, and the burst size
+PEXELS_RATE_PER_SECOND = float(os.environ.get('PEXELS_RATE_PER_SECOND', 2))
+PEXELS_BURST = int(os.environ.get('PEXELS_BURST', 10))
+# Retries for throttled (429) and failed (5xx) requests
+PEXELS_MAX_RETRIES = int(os.environ.get('PEXELS_MAX_RETRIES', 3))
+
+# Pexels src variants smallest first, with the box each is resized to fit
+# (None means unconstrained). Cropped variants (tiny, portrait, landscape)
+# are skipped because they change the framing of the photo.
+PEXELS_VARIANTS = [
+    ('small', None, 130),
+    ('medium', None, 350),
+    ('large', 940, 650),
+    ('large2x', 1880, 1300),
+]
+
+search_cache = DiskCache(os.path.join(BROLL_CACHE_DIR, 'search'), 16 * 1024 * 1024)
+image_cache = DiskCache(os.path.join(BROLL_CACHE_DIR, 'images'), BROLL_CACHE_MAX_MB * 1024 * 1024)
+client = PexelsClient(os.path.join(BROLL_CACHE_DIR, 'client'), rate=PEXELS_RATE_PER_SECOND, burst=PEXELS_BURST,
+                      max_retries=PEXELS_MAX_RETRIES, timeout=BROLL_REQUEST_TIMEOUT, pool_size=BROLL_WORKERS)
+
+
+def search_photo(search_term):
+    """Return the first Pexels photo for a search term, or None"""
+    def fetch():
+        response = client.get(
+            PEXELS_API_URL,
+            rate_limited=True,
+            headers={"Authorization": API_KEY},
+            params={
+                "query": search_term,
+                "per_page": 1,
+                "orientation": "landscape"
+            }
+        )
+        photos = response.json().get('photos')
+        entry = {'photo': photos[0] if photos else None}
+        # Empty results are cached too so unmatched terms aren't re-queried every job
+        search_cache.put_json(search_term, entry)
+        return entry
+
+    # Concurrent jobs searching for the same term share one request
+    entry = client.coalesce(
+        f"search:{search_term}",
+        lambda count=True: search_cache.get_json(search_term, ttl=BROLL_SEARCH_TTL, count=count),
+        fetch)
+    return entry.get('photo')
+
+
+def choose_variant(photo, target_width):
+    """Return the URL of the smallest photo variant at least target_width wide"""
+    src = photo['src']
+    width, height = photo.get('width'), photo.get('height')
+    if width and height:
+        for name, box_width, box_height in PEXELS_VARIANTS:
+            scale = min(box_width / width if box_width else 1.0,
+                        box_height / height if box_height else 1.0,
+                        1.0)
+            if name in src and width * scale >= target_width:
+                return src[name]
+    return src['original']
+
+
+def is_pexels_image_url(url):
+    """True for http(s) URLs on a host b-roll images are served from"""
+    parsed = urlparse(url)
+    return parsed.scheme in ('http', 'https') and parsed.hostname in PEXELS_IMAGE_HOSTS
+
+
+def download_image(url):
+    # Plans are editable by clients, so never fetch from anywhere but Pexels
+    if not is_pexels_image_url(url):
+        raise ValueError(f"Not a Pexels image URL: {url}")
+    # Images come from the CDN, which doesn't count against the API quota
+    return client.get(url).content
+
+
+def decode_scaled(content, target_width):
+    """Decode image bytes straight to an RGB array target_width pixels wide"""
+    image = Image.open(io.BytesIO(content))
+    target_height = max(round(image.height * target_width / image.width), 1)
+    # Let the JPEG decoder downscale by a power of two while decoding
+    image.draft('RGB', (target_width, target_height))
+    image = image.convert('RGB')
+    if image.size != (target_width, target_height):
+        image = image.resize((target_width, target_height), Image.LANCZOS)
+    return np.asarray(image)
+
+
+def load_overlay(url, target_width):
+    """Return the image at url as an overlay raster, using the cache when possible"""
+    key = f"{url}@{target_width}"
+
+    def lookup(count=True):
+        cached = image_cache.get(key, count=count)
+        return None if cached is None else np.load(io.BytesIO(cached))
+
+    def fetch():
+        raster = decode_scaled(download_image(url), target_width)
+        buffer = io.BytesIO()
+        np.save(buffer, raster)
+        image_cache.put(key, buffer.getvalue())
+        return raster
+
+    return client.coalesce(f"image:{key}", lookup, fetch)
+
+
+def cache_stats():
+    return {
+        'search': search_cache.stats(),
+        'images': image_cache.stats(),
+        'client': client.stats(),
+    }
+
+
+def fetch_broll(search_term, target_width):
+    """Resolve one search term to (image_url, overlay raster), or None"""
+    print(f"🔎 Using search term: '{search_term}'")
+
+    with span('broll_search', search_term=search_term):
+        photo = search_photo(search_term)
+    if not photo:
+        print("No images found for this chunk")
+        return None
+
+    url = choose_variant(photo, target_width)
+    with span('broll_download', search_term=search_term):
+        return url, load_overlay(url, target_width)
+
+
+def fetch_brolls(caption_chunks, target_width, max_brolls=MAX_BROLLS, deadline=BROLL_DEADLINE, progress=None):
+    """Fetch b-roll images for caption chunks concurrently.
+
+    Candidates (every BROLL_EVERY-th chunk) are resolved on a thread pool over
+    a shared session, and results are taken in chunk order until
+    ``max_brolls`` have been found or the deadline passes. Returns
+    ``(brolls, complete)``: a list of dicts with the ``search_term``,
+    ``image_url``, ``start`` and ``end`` of each b-roll and its ``image``, an
+    RGB array already scaled to ``target_width``, and False when the
+    deadline or a failed lookup may have cost b-roll that was available.
+    """
+    if not API_KEY:
+        print("Skipping b-roll processing because PEXELS_API_KEY is not set")
+        return [], True
+
+    candidates = caption_chunks[::BROLL_EVERY]
+    brolls = []
+    complete = True
+    if not candidates or max_brolls <= 0:
+        return brolls, complete
+
+    search_terms = find_search_terms([text for text, _, _ in candidates])
+
+    expires = time.monotonic() + deadline
+    pool = ThreadPoolExecutor(max_workers=max(BROLL_WORKERS, 1), thread_name_prefix='broll')
+    futures = [pool.submit(in_context(fetch_broll), term, target_width) for term in search_terms]
+    try:
+        for future, term, (_, start, end) in zip(futures, search_terms, candidates):
+            if len(brolls) >= max_brolls:
+                print(f"⏹️ B-roll limit reached ({max_brolls}), skipping remaining chunks")
+                break
+            try:
+                found = future.result(timeout=max(expires - time.monotonic(), 0))
+            except FutureTimeoutError:
+                print(f"B-roll deadline of {deadline:.0f}s reached, continuing with {len(brolls)} b-rolls")
+                complete = False
+                break
+            except Exception as e:
+                print(f"Error processing b-roll: {str(e)}")
+                complete = False
+                continue
+            if found is not None:
+                image_url, image = found
+                brolls.append({
+                    'search_term': term,
+                    'image_url': image_url,
+                    'image': image,
+                    'start': start,
+                    'end': end,
+                })
+                print(f"Added b-roll {len(brolls)}/{max_brolls}")
+                if progress:
+                    progress('broll', len(brolls) / max_brolls)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return brolls, complete
+
+
+def start_broll_fetch(caption_chunks, target_width, **kwargs):
+    """Run fetch_brolls in the background and return its Future.
+
+    Lets network time overlap with caption rendering in the caller.
+    """
+    runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='broll-runner')
+    # Carry the job's trace over so B-roll spans are recorded with it
+    future = runner.submit(in_context(fetch_brolls), caption_chunks, target_width, **kwargs)
+    runner.shutdown(wait=False)
+    return future
@@ -0,0 +1,81 @@
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from subtitles import CAPTION_STYLE
+
+# Configure settings from environment variables with defaults
+CAPTION_FONT = os.environ.get('CAPTION_FONT')
+# Number of rendered caption rasters kept in memory
+CAPTION_CACHE_SIZE = int(os.environ.get('CAPTION_CACHE_SIZE', 512))
+CAPTION_RENDER_THREADS = int(os.environ.get('CAPTION_RENDER_THREADS', 4))
+
+# Bold fonts tried in order when CAPTION_FONT is not set
+FALLBACK_FONTS = [
+    'Arial Bold.ttf',
+    'arialbd.ttf',
+    'DejaVuSans-Bold.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans-Bold.ttf',
+    '/Library/Fonts/Arial Bold.ttf',
+]
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(size):
+    """Load the caption font once per size"""
+    candidates = [CAPTION_FONT] if CAPTION_FONT else []
+    for path in candidates + FALLBACK_FONTS:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    print("Warning: No TrueType caption font found, using Pillow's default font")
+    return ImageFont.load_default()
+
+
+def style_key(style=None):
+    """Turn a style dict into a hashable cache key"""
+    return tuple(sorted(dict(CAPTION_STYLE, **(style or {})).items()))
+
+
+@functools.lru_cache(maxsize=CAPTION_CACHE_SIZE)
+def _render_caption(text, style_items):
+    style = dict(style_items)
+    font = load_font(style['fontsize'])
+    stroke = style['stroke_width']
+
+    # Measure with the stroke so the outline is never clipped
+    left, top, right, bottom = font.getbbox(text, stroke_width=stroke)
+    width, height = max(right - left, 1), max(bottom - top, 1)
+
+    image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text((-left, -top), text, font=font, fill=style['color'],
+                               stroke_width=stroke, stroke_fill=style['stroke_color'])
+    raster = np.asarray(image)
+    # Cached rasters are shared between clips, so make sure nobody edits them
+    raster.flags.writeable = False
+    return raster
+
+
+def render_caption(text, style=None):
+    """Render caption text to an RGBA array, reusing cached rasters"""
+    return _render_caption(text.strip(), style_key(style))
+
+
+def prerender_captions(texts, style=None, threads=CAPTION_RENDER_THREADS):
+    """Warm the raster cache for many captions across a thread pool"""
+    key = style_key(style)
+    unique = list(dict.fromkeys(text.strip() for text in texts))
+    # Rendering more than the cache holds would just evict earlier captions
+    unique = unique[:CAPTION_CACHE_SIZE]
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        list(pool.map(lambda text: _render_caption(text, key), unique))
+    return len(unique)
+
+
+def cache_info():
+    return _render_caption.cache_info()
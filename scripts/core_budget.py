@@ -0,0 +1,130 @@
+import contextlib
+import contextvars
+import fcntl
+import os
+import tempfile
+import time
+
+from metrics import span
+from model_registry import WHISPER_THREADS
+from render_profiles import RENDER_THREADS
+
+# Configure settings from environment variables with defaults
+# Cores shared by every worker and job on this host (0 uses the CPUs this process may run on)
+CPU_CORES = int(os.environ.get('CPU_CORES', 0)) or len(os.sched_getaffinity(0))
+# Cores a job holds while transcribing (torch threads) and while encoding (ffmpeg -threads)
+TRANSCRIBE_CORES = int(os.environ.get('TRANSCRIBE_CORES', WHISPER_THREADS or 4))
+ENCODE_CORES = int(os.environ.get('ENCODE_CORES', RENDER_THREADS or 4))
+# One lock file per core lives here; a held flock is a reserved core
+CORE_SLOTS_DIR = os.environ.get('CORE_SLOTS_DIR', os.path.join(tempfile.gettempdir(), 'video-cores'))
+# How often a waiting job looks for freed cores, in seconds
+POLL_INTERVAL = 0.1
+
+STAGE_CORES = {
+    'transcribe': TRANSCRIBE_CORES,
+    'encode': ENCODE_CORES,
+}
+
+# Cores reserved by the current context, so nested stages reuse them
+_reserved = contextvars.ContextVar('reserved_cores', default=None)
+
+
+def stage_cores(stage):
+    """Cores a stage is budgeted, never more than the host has"""
+    return min(max(STAGE_CORES[stage], 1), CPU_CORES)
+
+
+def _slot_path(slot):
+    return os.path.join(CORE_SLOTS_DIR, f"{slot:03d}.lock")
+
+
+def _release(slots):
+    for slot_file in slots:
+        # Unlock explicitly: forked pool processes may still hold the descriptor
+        fcntl.flock(slot_file, fcntl.LOCK_UN)
+        slot_file.close()
+
+
+def _acquire(cores):
+    """Lock `cores` slot files, waiting until enough are free.
+
+    Waiters queue on one lock and the head of the queue collects slots as
+    they free up, so a job needing many cores isn't starved by smaller ones.
+    No one waits while holding slots outside the queue, so there is no
+    deadlock, and slots held by a process that dies are released with it.
+    """
+    os.makedirs(CORE_SLOTS_DIR, exist_ok=True)
+    held = {}
+    with open(os.path.join(CORE_SLOTS_DIR, 'queue.lock'), 'a') as queue:
+        fcntl.flock(queue, fcntl.LOCK_EX)
+        try:
+            while True:
+                for slot in range(CPU_CORES):
+                    if len(held) == cores:
+                        return list(held.values())
+                    if slot in held:
+                        continue
+                    slot_file = open(_slot_path(slot), 'a')
+                    try:
+                        fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        slot_file.close()
+                        continue
+                    held[slot] = slot_file
+                if len(held) == cores:
+                    return list(held.values())
+                time.sleep(POLL_INTERVAL)
+        except BaseException:
+            _release(held.values())
+            raise
+        finally:
+            fcntl.flock(queue, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def reserve(stage, cores=None):
+    """Hold a stage's core budget for the duration of the block.
+
+    Yields the number of cores reserved, which the caller passes on as
+    torch threads or ffmpeg ``-threads``. Blocks until the cores are free.
+    A block inside another reservation reuses the outer one.
+    """
+    outer = _reserved.get()
+    if outer is not None:
+        yield outer
+        return
+
+    cores = min(max(cores or stage_cores(stage), 1), CPU_CORES)
+    with span('core_wait', budget=stage, requested=cores):
+        slots = _acquire(cores)
+    token = _reserved.set(cores)
+    try:
+        yield cores
+    finally:
+        _reserved.reset(token)
+        _release(slots)
+
+
+def reserved_cores():
+    """Count the cores currently reserved on this host"""
+    if not os.path.isdir(CORE_SLOTS_DIR):
+        return 0
+    reserved = 0
+    for slot in range(CPU_CORES):
+        try:
+            with open(_slot_path(slot), 'a') as slot_file:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(slot_file, fcntl.LOCK_UN)
+        except BlockingIOError:
+            reserved += 1
+        except OSError:
+            continue
+    return reserved
+
+
+def budget_status():
+    return {
+        'cores': CPU_CORES,
+        'reserved': reserved_cores(),
+        'stages': {stage: stage_cores(stage) for stage in STAGE_CORES},
+    }
@@ -0,0 +1,219 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Fraction of max_bytes to shrink to when eviction runs, so puts don't evict every time
+EVICT_TO = 0.9
+
+
+class DiskCache:
+    """Content-addressed, size-bounded LRU cache in a directory.
+
+    Keys are hashed to file names, writes are atomic renames and eviction and
+    the shared counters run under an flock, so several gunicorn workers and
+    job processes can use the same directory at once. Reads touch the entry's
+    mtime, which is what eviction orders by.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.root, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stats_path(self):
+        return os.path.join(self.root, 'stats.json')
+
+    def _read_stats(self):
+        try:
+            with open(self._stats_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_stats(self, stats):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, self._stats_path())
+
+    def _count(self, **deltas):
+        with self._locked():
+            stats = self._read_stats()
+            for field, delta in deltas.items():
+                stats[field] = stats.get(field, 0) + delta
+            self._write_stats(stats)
+            return stats
+
+    def get(self, key, count=True):
+        """Return the cached bytes for key, or None.
+
+        Pass ``count=False`` to look again without skewing the hit and miss
+        counters, e.g. when re-checking after waiting for another writer.
+        """
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Missing, or evicted by another process between open and utime
+            if count:
+                self._count(misses=1)
+            return None
+        if count:
+            self._count(hits=1)
+        return data
+
+    def put(self, key, data):
+        """Store bytes under key, evicting old entries if over the size limit"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        stats = self._count(bytes=len(data) - previous)
+        if stats.get('bytes', 0) > self.max_bytes:
+            self.evict()
+
+    def get_path(self, key):
+        """Return the path of the entry for key, or None.
+
+        For large entries that are streamed from disk rather than read into
+        memory. The entry may still be evicted while a reader has it open;
+        on POSIX the open file stays readable.
+        """
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._count(misses=1)
+            return None
+        self._count(hits=1)
+        return path
+
+    def put_file(self, key, src_path):
+        """Move a file into the cache under key and return its path in the cache"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        size = os.path.getsize(src_path)
+
+        # Rename when on the same filesystem, copy otherwise; either way the
+        # entry appears atomically
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        shutil.move(src_path, tmp_path)
+        os.replace(tmp_path, path)
+
+        stats = self._count(bytes=size - previous)
+        if stats.get('bytes', 0) > self.max_bytes:
+            self.evict()
+        return path
+
+    def get_json(self, key, ttl=None, count=True):
+        """Return a cached JSON value, or None if missing or older than ttl seconds"""
+        data = self.get(key, count=count)
+        if data is None:
+            return None
+        try:
+            entry = json.loads(data)
+        except ValueError:
+            return None
+        if ttl is not None and time.time() - entry.get('stored_at', 0) > ttl:
+            self.delete(key)
+            return None
+        return entry.get('value')
+
+    def put_json(self, key, value):
+        self.put(key, json.dumps({'stored_at': time.time(), 'value': value}).encode('utf-8'))
+
+    def delete(self, key):
+        path = self.path_for(key)
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        except OSError:
+            return
+        self._count(bytes=-size)
+
+    def evict(self):
+        """Delete least recently used entries until under the size limit"""
+        with self._locked():
+            entries = []
+            for dirpath, _, filenames in os.walk(self.root):
+                if dirpath == self.root:
+                    continue
+                for name in filenames:
+                    # Leave in-progress writes from other processes alone
+                    if name.endswith('.tmp'):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+
+            stats = self._read_stats()
+            stats['bytes'] = total
+            stats['evictions'] = stats.get('evictions', 0) + evicted
+            self._write_stats(stats)
+
+    def clear(self):
+        """Delete every entry and reset the counters"""
+        with self._locked():
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+            self._write_stats({})
+
+    def stats(self):
+        stats = self._read_stats()
+        return {
+            'hits': stats.get('hits', 0),
+            'misses': stats.get('misses', 0),
+            'evictions': stats.get('evictions', 0),
+            'bytes': stats.get('bytes', 0),
+            'max_bytes': self.max_bytes,
+        }
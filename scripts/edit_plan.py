@@ -0,0 +1,271 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from moviepy.editor import VideoFileClip
+
+from broll import fetch_brolls, load_overlay
+from core_budget import reserve
+from model_registry import resolve_name
+from parallel_render import concat_parts, keyframe_times, overlays_in_range, render_ranges
+from ffmpeg_render import render_ffmpeg, run_ffmpeg
+from process_video import RENDER_BACKEND, build_caption_chunks, render_video, transcribe_video
+from plan_format import PLAN_VERSION, dirty_ranges, expand_to_keyframes, validate_plan
+from render_profiles import RENDER_PROFILE, encoder_args
+
+# Configure settings from environment variables with defaults
+PLAN_DIR = os.environ.get('PLAN_DIR', os.path.join(tempfile.gettempdir(), 'video-plans'))
+# How long an untouched plan (with its source and last output) is kept
+PLAN_RETENTION_SECONDS = int(os.environ.get('PLAN_RETENTION_SECONDS', 24 * 3600))
+# Previews are rendered at this height and frame rate at most
+PREVIEW_HEIGHT = int(os.environ.get('PREVIEW_HEIGHT', 360))
+PREVIEW_FPS = float(os.environ.get('PREVIEW_FPS', 12))
+# Speed over size and quality: nobody keeps a preview
+PREVIEW_ENCODE_ARGS = [
+    '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'fastdecode', '-crf', '32',
+    '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+]
+# Skipping the deblocking filter makes decoding much cheaper at the cost of
+# artifacts that disappear once the frame is scaled down
+PREVIEW_DECODE_ARGS = ['-skip_loop_filter', 'all']
+
+
+def analyze(input_path, model_name=None, render_profile=None, progress=None):
+    """Transcribe a video and choose its captions and b-roll, without rendering.
+
+    Returns a JSON-serializable edit plan that render_plan can turn into a
+    video. Users can edit captions and b-roll in the plan before rendering.
+    """
+    video = VideoFileClip(input_path)
+    try:
+        if progress:
+            progress('transcribing', 0.0)
+        result = transcribe_video(input_path, model_name)
+        caption_chunks = build_caption_chunks(result)
+
+        if progress:
+            progress('broll', 0.0)
+        broll_width = video.w // 2
+        brolls, _ = fetch_brolls(caption_chunks, broll_width, progress=progress)
+
+        return {
+            'version': PLAN_VERSION,
+            'source': {
+                'duration': video.duration,
+                'fps': video.fps,
+                'width': video.w,
+                'height': video.h,
+            },
+            'settings': {
+                'model_name': resolve_name(model_name),
+                'render_profile': render_profile or RENDER_PROFILE,
+            },
+            'captions': [
+                {'id': f"c{i}", 'text': text.strip(), 'start': round(start, 3), 'end': round(end, 3)}
+                for i, (text, start, end) in enumerate(caption_chunks)
+            ],
+            'brolls': [
+                {
+                    'id': f"b{i}",
+                    'search_term': b['search_term'],
+                    'image_url': b['image_url'],
+                    'width': broll_width,
+                    'start': round(b['start'], 3),
+                    'end': round(b['end'], 3),
+                }
+                for i, b in enumerate(brolls)
+            ],
+        }
+    finally:
+        video.close()
+
+
+def plan_overlays(plan):
+    """Return (caption_chunks, brolls) ready for the renderers"""
+    caption_chunks = [(c['text'], c['start'], c['end']) for c in plan['captions']]
+    default_width = plan['source']['width'] // 2
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        images = list(pool.map(lambda b: load_overlay(b['image_url'], b.get('width', default_width)),
+                               plan['brolls']))
+    brolls = [(image, b['start'], b['end']) for image, b in zip(images, plan['brolls'])]
+    return caption_chunks, brolls
+
+
+def copy_range(path, start, end, part_path):
+    """Cut [start, end) out of a video without re-encoding; start must be a keyframe"""
+    run_ffmpeg([
+        '-ss', f"{start:.6f}", '-i', path,
+        '-t', f"{end - start:.6f}",
+        '-map', '0:v', '-c', 'copy',
+        '-avoid_negative_ts', 'make_zero',
+        part_path,
+    ])
+
+
+def render_ranges_ffmpeg(source_path, ranges, part_paths, caption_chunks, brolls, source, profile=None,
+                         cores=None, progress=None):
+    """Render each (start, end) range to its part path with ffmpeg, without audio.
+
+    The source is seeked with input options, so the range starts at 0 and
+    only the captions and b-roll overlapping it are drawn, shifted to match.
+    """
+    threads = ['-threads', str(cores)] if cores else []
+    for done, (part_path, (start, end)) in enumerate(zip(part_paths, ranges), 1):
+        render_ffmpeg(source_path, part_path, overlays_in_range(caption_chunks, start, end),
+                      overlays_in_range(brolls, start, end), (source['width'], source['height']),
+                      source['fps'], end - start,
+                      encode_args=encoder_args(profile, threads=cores),
+                      decode_args=['-ss', f"{start:.6f}", '-t', f"{end - start:.6f}", *threads],
+                      audio=False)
+        if progress:
+            progress('rendering', done / len(ranges))
+
+
+def render_plan(plan, source_path, output_path, previous_plan=None, previous_output=None,
+                backend=None, segments=None, progress=None):
+    """Render an edit plan, re-encoding only what changed since the previous render.
+
+    With a previous plan and its output, only time ranges whose captions or
+    b-roll changed are rendered again (widened to the previous output's
+    keyframes). Everything else is stream-copied from the previous output,
+    and the parts are spliced with the concat demuxer. The encoder settings
+    come from the plan's ``settings.render_profile``.
+
+    Returns the backend that rendered the output, to be recorded as the
+    rendered plan's ``settings.render_backend``. Ranges are only re-rendered
+    with the backend that made the previous output, since MoviePy and
+    ffmpeg draw captions differently; otherwise the whole plan is rendered.
+    """
+    validate_plan(plan)
+    caption_chunks, brolls = plan_overlays(plan)
+    duration = plan['source']['duration']
+    profile = plan.get('settings', {}).get('render_profile')
+    backend = backend or RENDER_BACKEND
+
+    dirty = None
+    previous_backend = ((previous_plan or {}).get('settings') or {}).get('render_backend', 'moviepy')
+    if previous_plan and previous_output and os.path.exists(previous_output) and previous_backend == backend:
+        dirty = dirty_ranges(previous_plan, plan)
+        if dirty:
+            dirty = expand_to_keyframes(dirty, keyframe_times(previous_output), duration)
+
+    if dirty is None or (dirty and dirty[0][0] <= 0 and dirty[-1][1] >= duration and len(dirty) == 1):
+        # Nothing reusable: render the whole timeline
+        video = VideoFileClip(source_path)
+        try:
+            return render_video(video, source_path, output_path, caption_chunks, brolls,
+                                backend=backend, segments=segments, profile=profile, progress=progress)
+        finally:
+            video.close()
+
+    if not dirty:
+        print("Plan unchanged, reusing previous render")
+        shutil.copyfile(previous_output, output_path)
+        return backend
+
+    rerendered = sum(end - start for start, end in dirty)
+    print(f"Re-rendering {rerendered:.1f}s of {duration:.1f}s in {len(dirty)} ranges")
+
+    # Alternate clean (copied) and dirty (rendered) parts along the timeline
+    parts = []
+    position = 0.0
+    for start, end in dirty:
+        if start > position:
+            parts.append((position, start, False))
+        parts.append((start, end, True))
+        position = end
+    if position < duration:
+        parts.append((position, duration, False))
+
+    work_dir = tempfile.mkdtemp(prefix='plan-render-')
+    try:
+        part_paths = [os.path.join(work_dir, f"part-{i:04d}.mp4") for i in range(len(parts))]
+        dirty_parts = [(path, (start, end)) for path, (start, end, is_dirty) in zip(part_paths, parts) if is_dirty]
+        ranges, paths = [r for _, r in dirty_parts], [p for p, _ in dirty_parts]
+        with reserve('encode') as cores:
+            if backend == 'ffmpeg':
+                render_ranges_ffmpeg(source_path, ranges, paths, caption_chunks, brolls, plan['source'],
+                                     profile=profile, cores=cores, progress=progress)
+            else:
+                render_ranges(source_path, ranges, paths, caption_chunks, brolls, profile=profile,
+                              cores=cores, progress=progress)
+        for path, (start, end, is_dirty) in zip(part_paths, parts):
+            if not is_dirty:
+                copy_range(previous_output, start, end, path)
+        concat_parts(part_paths, source_path, output_path, profile=profile)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return backend
+
+
+def render_preview(plan, source_path, output_path, height=PREVIEW_HEIGHT, fps=PREVIEW_FPS, progress=None):
+    """Render a quick low-resolution proxy of an edit plan with ffmpeg.
+
+    The source is scaled down before anything is composited and captions and
+    b-roll are drawn at the scaled size, so a preview costs a fraction of
+    the full render and can be checked before committing to it.
+    """
+    validate_plan(plan)
+    caption_chunks, brolls = plan_overlays(plan)
+    source = plan['source']
+    scale = min(height / source['height'], 1.0)
+    run_fps = min(fps, source['fps'])
+    with reserve('encode') as cores:
+        render_ffmpeg(source_path, output_path, caption_chunks, brolls,
+                      (source['width'], source['height']), run_fps, source['duration'],
+                      progress=progress, scale=scale,
+                      encode_args=PREVIEW_ENCODE_ARGS + ['-threads', str(cores)],
+                      decode_args=PREVIEW_DECODE_ARGS + ['-threads', str(cores)])
+    return output_path
+
+
+def plan_dir(plan_id):
+    return os.path.join(PLAN_DIR, plan_id)
+
+
+def plan_file(plan_id, name):
+    """Path of a file belonging to a stored plan (source.mp4, plan.json, ...)"""
+    return os.path.join(plan_dir(plan_id), name)
+
+
+def create_plan_dir():
+    cleanup_expired_plans()
+    plan_id = str(uuid.uuid4())
+    os.makedirs(plan_dir(plan_id), exist_ok=True)
+    return plan_id
+
+
+def save_json(plan_id, name, data):
+    fd, tmp_path = tempfile.mkstemp(dir=plan_dir(plan_id), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, plan_file(plan_id, name))
+
+
+def load_json(plan_id, name):
+    """Load a stored plan file, or None for unknown plans"""
+    try:
+        uuid.UUID(plan_id)
+    except ValueError:
+        return None
+    try:
+        with open(plan_file(plan_id, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def cleanup_expired_plans():
+    if not os.path.isdir(PLAN_DIR):
+        return
+    cutoff = time.time() - PLAN_RETENTION_SECONDS
+    for plan_id in os.listdir(PLAN_DIR):
+        try:
+            if os.path.getmtime(plan_dir(plan_id)) < cutoff:
+                shutil.rmtree(plan_dir(plan_id), ignore_errors=True)
+        except OSError:
+            continue
@@ -0,0 +1,216 @@
+import os
+import subprocess
+import tempfile
+
+from PIL import Image
+
+from render_profiles import container_args, encoder_args
+from subtitles import CAPTION_STYLE, subtitle_language, to_ass, to_srt
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+# Audio codecs that can be stream-copied into an MP4 as they are
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'ac3', 'eac3'}
+
+
+def escape_filter_path(path):
+    """Quote a file path for use as a filtergraph option value"""
+    return "'" + path.replace('\\', '/').replace("'", r"'\''") + "'"
+
+
+def build_filter_complex(brolls, subtitles_path, base_filter=None):
+    """Build the filtergraph that overlays B-roll and burns in captions.
+
+    Input 0 is the source video and input ``i`` (1-based) is the image for
+    ``brolls[i - 1]``, already at its overlay size. Each image is shown
+    centred at the top only while its caption chunk is on screen, mirroring
+    the MoviePy renderer. ``base_filter`` (e.g. scaling) is applied to the
+    source before anything is overlaid. The graph's output pad is ``[vout]``.
+    """
+    filters = []
+    current = '[0:v]'
+    if base_filter:
+        filters.append(f"[0:v]{base_filter}[base]")
+        current = '[base]'
+    for i, (_, start, end) in enumerate(brolls, 1):
+        filters.append(f"{current}[{i}:v]overlay=x=(W-w)/2:y=0:"
+                       f"enable='between(t,{start:.3f},{end:.3f})'[v{i}]")
+        current = f'[v{i}]'
+    filters.append(f"{current}ass=filename={escape_filter_path(subtitles_path)}[vout]")
+    return ';'.join(filters)
+
+
+def run_ffmpeg(args, duration=None, progress=None):
+    """Run ffmpeg, forwarding its progress as a fraction of ``duration``"""
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-nostats', '-y']
+    if progress and duration:
+        cmd += ['-progress', 'pipe:1']
+    cmd += args
+
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        last_percent = -1
+        for line in proc.stdout:
+            # -progress emits key=value lines; out_time_us is the encoded position
+            key, _, value = line.strip().partition('=')
+            if key == 'out_time_us' and value.isdigit():
+                percent = min(int(100 * int(value) / 1e6 / duration), 100)
+                if percent != last_percent:
+                    last_percent = percent
+                    progress('rendering', percent / 100)
+        returncode = proc.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            tail = stderr.read()[-2000:].decode(errors='replace')
+            raise RuntimeError(f"ffmpeg exited with code {returncode}: {tail}")
+
+
+def scaled_size(size, scale):
+    """Scale a (width, height) keeping both even, as libx264 requires"""
+    return tuple(max(int(round(d * scale / 2)) * 2, 2) for d in size)
+
+
+def render_ffmpeg(input_path, output_path, caption_chunks, brolls, size, fps, duration, progress=None,
+                  scale=1.0, encode_args=None, decode_args=None, audio=True):
+    """Render captions and B-roll in a single ffmpeg invocation.
+
+    ``brolls`` is a list of (image, start, end) with RGB arrays. Captions are burned in
+    from a generated ASS file and B-roll is composited with timed overlay
+    filters, so no frame ever passes through Python. With ``scale`` below 1
+    the video is downscaled first and captions and B-roll are drawn at the
+    scaled size, which is how previews are made. ``encode_args`` replaces
+    the default render profile's encoder settings and ``decode_args`` are
+    input options for the source. Audio is stream-copied when MP4 can hold it,
+    or left out with ``audio=False``.
+    """
+    width, height = size
+    base_filter = None
+    style = None
+    if scale != 1.0:
+        width, height = scaled_size(size, scale)
+        # Drop frames before scaling so the filters only see what gets encoded
+        base_filter = f"fps={fps},scale={width}:{height}"
+        style = {
+            'fontsize': max(int(round(CAPTION_STYLE['fontsize'] * scale)), 8),
+            'stroke_width': max(int(round(CAPTION_STYLE['stroke_width'] * scale)), 1),
+        }
+
+    with tempfile.NamedTemporaryFile('w', suffix='.ass', delete=False, encoding='utf-8') as f:
+        f.write(to_ass(caption_chunks, width, height, style=style))
+        subtitles_path = f.name
+    temp_files = [subtitles_path]
+
+    try:
+        args = [*(decode_args or []), '-i', input_path]
+        # ffmpeg reads overlays from files; the rasters are small, so PNG is cheap
+        for image, _, _ in brolls:
+            overlay = Image.fromarray(image)
+            if scale != 1.0:
+                overlay = overlay.resize(scaled_size(overlay.size, scale), Image.BILINEAR)
+            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+                overlay.save(f, format='PNG', compress_level=1)
+                temp_files.append(f.name)
+            args += ['-i', f.name]
+        args += [
+            '-filter_complex', build_filter_complex(brolls, subtitles_path, base_filter),
+            '-map', '[vout]',
+        ]
+        args += encode_args or encoder_args()
+        args += ['-map', '0:a?', *audio_args(input_path)] if audio else ['-an']
+        args += ['-r', str(fps), output_path]
+        run_ffmpeg(args, duration=duration, progress=progress)
+    finally:
+        for path in temp_files:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def probe_size(input_path):
+    """Return the (width, height) of the first video stream"""
+    cmd = [
+        FFPROBE_BINARY, '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height', '-of', 'csv=p=0:s=x',
+        input_path,
+    ]
+    output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip()
+    width, _, height = output.partition('x')
+    return int(width), int(height)
+
+
+def probe_audio_codec(input_path):
+    """Return the codec name of the first audio stream, or None without audio"""
+    cmd = [
+        FFPROBE_BINARY, '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name', '-of', 'csv=p=0',
+        input_path,
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return proc.stdout.strip() or None
+
+
+def audio_args(input_path):
+    """Copy the source audio when MP4 can hold it, otherwise encode AAC.
+
+    None of the renderers change the audio, so re-encoding it would only
+    cost time and a generation of quality.
+    """
+    if probe_audio_codec(input_path) in MP4_AUDIO_CODECS:
+        return ['-c:a', 'copy']
+    return ['-c:a', 'aac']
+
+
+def mux_audio(video_path, input_path, output_path, profile=None, concat=False):
+    """Combine a rendered video-only file with the source's audio, copying both.
+
+    With ``concat`` the video path is a concat demuxer list of parts.
+    """
+    video_input = ['-f', 'concat', '-safe', '0', '-i', video_path] if concat else ['-i', video_path]
+    run_ffmpeg([
+        *video_input,
+        '-i', input_path,
+        '-map', '0:v', '-map', '1:a?',
+        '-c:v', 'copy', *audio_args(input_path),
+        *container_args(profile),
+        '-shortest',
+        output_path,
+    ])
+
+
+def mux_soft_subtitles(input_path, output_path, caption_chunks, language=None):
+    """Add captions as a mov_text subtitle track without re-encoding the video.
+
+    Video and audio are stream-copied. Codecs MP4 can't hold (e.g. Vorbis
+    audio, VP8 video from WebM uploads) are re-encoded as a fallback.
+    ``language`` is the code Whisper detected; the track is tagged with it.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.srt', delete=False, encoding='utf-8') as f:
+        f.write(to_srt(caption_chunks))
+        subtitles_path = f.name
+
+    attempts = [
+        ['-c:v', 'copy', '-c:a', 'copy'],
+        ['-c:v', 'copy', '-c:a', 'aac'],
+        ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac'],
+    ]
+    try:
+        for i, codecs in enumerate(attempts):
+            try:
+                run_ffmpeg([
+                    '-i', input_path, '-i', subtitles_path,
+                    '-map', '0:v:0', '-map', '0:a?', '-map', '1:0',
+                    *codecs,
+                    '-c:s', 'mov_text', '-metadata:s:s:0', f"language={subtitle_language(language)}",
+                    '-movflags', '+faststart',
+                    output_path,
+                ])
+                return output_path
+            except RuntimeError as e:
+                if i == len(attempts) - 1:
+                    raise
+                print(f"Stream copy not possible ({' '.join(codecs)}), retrying: {str(e)[-200:]}")
+    finally:
+        os.unlink(subtitles_path)
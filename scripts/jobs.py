@@ -0,0 +1,305 @@
+import contextlib
+import fcntl
+import functools
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import cpu_summary, span, trace
+
+# Configure settings from environment variables with defaults
+# Jobs running at once on this host, across all gunicorn workers
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Jobs allowed to wait for a free worker before new submissions are rejected (per host)
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 8))
+# How long finished jobs (and their outputs) are kept around
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 3600))
+# Unfinished jobs whose status hasn't been touched for this long lost their worker
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 300))
+JOB_DIR = os.environ.get('JOB_DIR', os.path.join(tempfile.gettempdir(), 'video-jobs'))
+# How often the process that owns a job marks it alive, in seconds
+HEARTBEAT_SECONDS = 30
+ACTIVE_STATES = ('uploading', 'queued', 'running')
+
+_executor = None
+# Unfinished jobs submitted from this process, kept alive by the heartbeat
+_owned = set()
+_heartbeat_pid = None
+_lock = threading.Lock()
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+
+def job_dir(job_id):
+    return os.path.join(JOB_DIR, job_id)
+
+
+def input_path(job_id):
+    return os.path.join(job_dir(job_id), 'input.mp4')
+
+
+def output_path(job_id):
+    return os.path.join(job_dir(job_id), 'output.mp4')
+
+
+def status_path(job_id):
+    return os.path.join(job_dir(job_id), 'status.json')
+
+
+@contextlib.contextmanager
+def _locked(name):
+    """Hold an flock on a file in JOB_DIR, shared by every process on the host"""
+    os.makedirs(JOB_DIR, exist_ok=True)
+    with open(os.path.join(JOB_DIR, name), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _acquire_run_slot():
+    """Wait for one of the host's JOB_WORKERS run slots; returns its locked file.
+
+    Each gunicorn worker has its own pool, so pool processes wait here and
+    only JOB_WORKERS jobs run at once on the host.
+    """
+    while True:
+        for slot in range(max(JOB_WORKERS, 1)):
+            slot_file = open(os.path.join(JOB_DIR, f".run-{slot}.lock"), 'a')
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot_file
+            except BlockingIOError:
+                slot_file.close()
+        time.sleep(0.5)
+
+
+def _heartbeat():
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        with _lock:
+            owned = list(_owned)
+        for job_id in owned:
+            # Touch rather than rewrite, so the pool process's status updates aren't clobbered
+            try:
+                os.utime(status_path(job_id))
+            except OSError:
+                pass
+
+
+def _own(job_id):
+    """Keep a job marked alive for as long as this process holds it"""
+    global _heartbeat_pid
+    with _lock:
+        _owned.add(job_id)
+        # Threads don't survive fork, so each gunicorn worker starts its own
+        if _heartbeat_pid != os.getpid():
+            _heartbeat_pid = os.getpid()
+            threading.Thread(target=_heartbeat, daemon=True).start()
+
+
+def _disown(job_id):
+    with _lock:
+        _owned.discard(job_id)
+
+
+def write_status(job_id, **fields):
+    """Merge fields into the job's status file.
+
+    Status lives on disk so any gunicorn worker can answer polls and the pool
+    process running the job can report progress without talking back to us.
+    """
+    status = read_status(job_id) or {'id': job_id}
+    status.update(fields)
+    status['updated_at'] = time.time()
+    path = status_path(job_id)
+    fd, tmp_path = tempfile.mkstemp(dir=job_dir(job_id), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+
+def read_status(job_id):
+    """Return the job's status dict, or None for unknown jobs"""
+    # Job ids are uuids; refuse anything that could escape JOB_DIR
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    try:
+        with open(status_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _run_job(job_id, options):
+    """Run the pipeline for one job inside a pool process"""
+    from process_video import process_video
+
+    def progress(stage, fraction):
+        write_status(job_id, state='running', stage=stage, progress=round(fraction, 3))
+
+    slot = _acquire_run_slot()
+    with trace(job_id) as spans:
+        try:
+            write_status(job_id, state='running', stage='starting', progress=0.0, started_at=time.time())
+            process_video(input_path(job_id), output_path(job_id), progress=progress, **options)
+            write_status(job_id, state='done', stage='done', progress=1.0, finished_at=time.time())
+        except Exception as e:
+            traceback.print_exc()
+            write_status(job_id, state='failed', error=str(e), finished_at=time.time())
+        finally:
+            with span('cleanup'):
+                try:
+                    os.remove(input_path(job_id))
+                except OSError:
+                    pass
+                fcntl.flock(slot, fcntl.LOCK_UN)
+                slot.close()
+    write_status(job_id, spans=spans, cpu=cpu_summary(spans))
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Fork so pool processes inherit already loaded Whisper models
+            _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS,
+                                            mp_context=multiprocessing.get_context('fork'))
+        return _executor
+
+
+def _reset_executor(broken):
+    """Drop a pool that lost a process so the next submission starts a new one"""
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(job_id, options):
+    executor = _get_executor()
+    try:
+        future = executor.submit(_run_job, job_id, options)
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        future = _get_executor().submit(_run_job, job_id, options)
+    future.add_done_callback(functools.partial(_job_finished, job_id, options, executor))
+
+
+def _job_finished(job_id, options, executor, future):
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        # A pool process died (OOM kill, segfault) and took the pool with it
+        _reset_executor(executor)
+        status = read_status(job_id) or {}
+        if status.get('state') == 'queued' and not status.get('requeued'):
+            # Never started, so it didn't kill the pool: run it on a new one
+            write_status(job_id, requeued=True)
+            _submit(job_id, options)
+            return
+    _disown(job_id)
+    # _run_job records its own failures; this catches pool processes that died
+    if error is not None:
+        write_status(job_id, state='failed', error=str(error) or type(error).__name__, finished_at=time.time())
+
+
+def create_job():
+    """Reserve a job id and directory, rejecting it if the host's queue is full"""
+    expire_stale_jobs()
+    # Count and reserve under one lock so concurrent workers can't overshoot
+    with _locked('.admit.lock'):
+        if in_flight() >= JOB_WORKERS + JOB_QUEUE_SIZE:
+            raise QueueFullError(f"Job queue is full ({JOB_QUEUE_SIZE} waiting)")
+        job_id = str(uuid.uuid4())
+        os.makedirs(job_dir(job_id), exist_ok=True)
+        write_status(job_id, state='uploading', stage='upload', progress=0.0, created_at=time.time())
+    _own(job_id)
+    return job_id
+
+
+def submit_job(job_id, **options):
+    """Queue a job whose input has been saved to input_path(job_id)"""
+    write_status(job_id, state='queued', stage='queued', progress=0.0)
+    _submit(job_id, options)
+    cleanup_expired_jobs()
+    return job_id
+
+
+def abandon_job(job_id):
+    """Release a reserved slot for a job that was never submitted"""
+    _disown(job_id)
+    shutil.rmtree(job_dir(job_id), ignore_errors=True)
+
+
+def in_flight():
+    """Jobs uploading, queued or running on this host"""
+    counts = job_counts()
+    return sum(counts.get(state, 0) for state in ACTIVE_STATES)
+
+
+def queue_status():
+    return {
+        'workers': JOB_WORKERS,
+        'queue_size': JOB_QUEUE_SIZE,
+        'in_flight': in_flight(),
+    }
+
+
+def job_counts():
+    """Count jobs by state across all processes, from their status files"""
+    counts = {}
+    if not os.path.isdir(JOB_DIR):
+        return counts
+    for job_id in os.listdir(JOB_DIR):
+        status = read_status(job_id)
+        if status:
+            counts[status.get('state')] = counts.get(status.get('state'), 0) + 1
+    return counts
+
+
+def expire_stale_jobs():
+    """Fail unfinished jobs whose owning process stopped marking them alive.
+
+    The process that accepted a job touches its status file every
+    HEARTBEAT_SECONDS until the job ends, so a job untouched for
+    JOB_STALE_SECONDS belonged to a worker that was killed or restarted.
+    """
+    if not os.path.isdir(JOB_DIR):
+        return
+    cutoff = time.time() - JOB_STALE_SECONDS
+    for job_id in os.listdir(JOB_DIR):
+        status = read_status(job_id)
+        if not status or status.get('state') not in ACTIVE_STATES:
+            continue
+        try:
+            touched = os.path.getmtime(status_path(job_id))
+        except OSError:
+            continue
+        if max(touched, status.get('updated_at', 0)) < cutoff:
+            write_status(job_id, state='failed', error='Job was lost when its worker stopped',
+                         finished_at=time.time())
+
+
+def cleanup_expired_jobs():
+    """Delete finished jobs older than JOB_RETENTION_SECONDS"""
+    if not os.path.isdir(JOB_DIR):
+        return
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for job_id in os.listdir(JOB_DIR):
+        status = read_status(job_id)
+        if status and status.get('state') in ('done', 'failed') and status.get('updated_at', 0) < cutoff:
+            shutil.rmtree(job_dir(job_id), ignore_errors=True)
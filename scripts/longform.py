@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+# Configure settings from environment variables with defaults
+# Audio longer than this (in seconds) is split and transcribed in parallel
+LONGFORM_MIN_SECONDS = float(os.environ.get('LONGFORM_MIN_SECONDS', 300))
+# Target length of each piece, in seconds
+LONGFORM_PIECE_SECONDS = float(os.environ.get('LONGFORM_PIECE_SECONDS', 120))
+LONGFORM_WORKERS = int(os.environ.get('LONGFORM_WORKERS', max((os.cpu_count() or 1) // 2, 1)))
+# How far either side of a target cut to look for silence, in seconds
+SILENCE_SEARCH_SECONDS = 10.0
+# Energy is measured over 20 ms frames and smoothed over 300 ms
+FRAME_SECONDS = 0.02
+SMOOTH_FRAMES = 15
+
+# Set in the parent before forking so pool processes inherit them copy-on-write
+_model = None
+_audio = None
+_options = None
+
+
+def split_at_silence(audio, sample_rate=SAMPLE_RATE, piece_seconds=LONGFORM_PIECE_SECONDS,
+                     search_seconds=SILENCE_SEARCH_SECONDS):
+    """Split audio into (start, end) sample ranges cut at the quietest moments.
+
+    Each cut is placed at the lowest smoothed RMS energy within
+    ``search_seconds`` of where a ``piece_seconds`` piece would end, so words
+    are not split between pieces.
+    """
+    frame = int(sample_rate * FRAME_SECONDS)
+    frame_count = len(audio) // frame
+    if frame_count == 0:
+        return [(0, len(audio))]
+
+    frames = audio[:frame_count * frame].reshape(frame_count, frame)
+    energy = np.sqrt(np.mean(frames ** 2, axis=1))
+    energy = np.convolve(energy, np.ones(SMOOTH_FRAMES) / SMOOTH_FRAMES, mode='same')
+
+    piece = int(piece_seconds * sample_rate)
+    search = int(search_seconds * sample_rate)
+    cuts = [0]
+    # Stop once the remainder would make a reasonably sized final piece
+    while len(audio) - cuts[-1] > piece + search:
+        target = cuts[-1] + piece
+        low = max((target - search) // frame, cuts[-1] // frame + 1)
+        high = min((target + search) // frame, frame_count)
+        cuts.append(int(low + np.argmin(energy[low:high])) * frame)
+    cuts.append(len(audio))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _transcribe_piece(bounds):
+    start, end = bounds
+    result = _model.transcribe(_audio[start:end], **_options)
+    return result['segments'], result.get('language')
+
+
+def shift_segments(segments, offset):
+    """Move segment and word timestamps by offset seconds"""
+    for segment in segments:
+        segment['start'] += offset
+        segment['end'] += offset
+        for word in segment.get('words', []):
+            word['start'] += offset
+            word['end'] += offset
+    return segments
+
+
+def transcribe(model, audio, workers=LONGFORM_WORKERS, cores=None, **options):
+    """Transcribe audio, splitting long recordings across a process pool.
+
+    Short audio, GPU models and single-worker setups use one
+    ``model.transcribe`` call. Otherwise the audio is cut at silences and the
+    pieces are transcribed by forked processes that share the already loaded
+    model, then stitched back into one Whisper-shaped result with
+    absolute timestamps. ``cores`` (default all of them) is split between
+    the processes as torch threads.
+    """
+    global _model, _audio, _options
+
+    duration = len(audio) / SAMPLE_RATE
+    if duration < LONGFORM_MIN_SECONDS or workers <= 1 or cores == 1 or model.device.type != 'cpu':
+        return model.transcribe(audio, **options)
+
+    pieces = split_at_silence(audio)
+    if len(pieces) == 1:
+        return model.transcribe(audio, **options)
+
+    cores = cores or os.cpu_count() or 1
+    processes = min(workers, len(pieces), cores)
+    threads = max(cores // processes, 1)
+    print(f"Transcribing {duration:.0f}s of audio as {len(pieces)} pieces on {processes} processes")
+
+    _model, _audio, _options = model, audio, options
+    try:
+        with multiprocessing.get_context('fork').Pool(processes, initializer=_init_worker,
+                                                      initargs=(threads,)) as pool:
+            results = pool.map(_transcribe_piece, pieces, chunksize=1)
+    finally:
+        _model = _audio = _options = None
+
+    segments = []
+    for (start, _), (piece_segments, _) in zip(pieces, results):
+        segments.extend(shift_segments(piece_segments, start / SAMPLE_RATE))
+    for index, segment in enumerate(segments):
+        segment['id'] = index
+
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': results[0][1],
+    }
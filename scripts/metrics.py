@@ -0,0 +1,327 @@
+import contextlib
+import contextvars
+import fcntl
+import functools
+import glob
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import uuid
+
+# Configure settings from environment variables with defaults
+# Every process writes its stage metrics here; /metrics sums the files
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'video-metrics'))
+# Upper bounds (in seconds) of the stage latency histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# How often resident memory is sampled while spans are open, in seconds
+RSS_SAMPLE_INTERVAL = 0.1
+# Stage totals of processes that have exited, folded out of their own files
+TOTALS_FILE = 'totals.json'
+
+# Spans of the job running in the current context, if any
+_trace = contextvars.ContextVar('trace', default=None)
+_lock = threading.Lock()
+# stage -> {'buckets': [...], 'count': n, 'sum': s, 'cpu': s, 'peak_rss': bytes}
+_stages = {}
+_metrics_path = None
+# Highest RSS sampled so far for each open span
+_open_spans = {}
+_sampler_pid = None
+
+
+def _reset_after_fork():
+    """Forked children start with empty metrics and their own file"""
+    global _lock, _metrics_path
+    _lock = threading.Lock()
+    _stages.clear()
+    _metrics_path = None
+    _open_spans.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def cpu_seconds():
+    """CPU time of this process plus its reaped children (ffmpeg, worker pools)"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def rss_bytes():
+    """Resident memory of this process right now"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Without procfs the lifetime peak is all there is
+        return peak_rss_bytes()
+
+
+def _sample_rss():
+    while True:
+        time.sleep(RSS_SAMPLE_INTERVAL)
+        if not _open_spans:
+            continue
+        rss = rss_bytes()
+        with _lock:
+            for key, peak in _open_spans.items():
+                if rss > peak:
+                    _open_spans[key] = rss
+
+
+def _open_span():
+    """Start tracking the peak RSS of a span and return its key.
+
+    ru_maxrss and VmHWM only know the process's peak since it started (or
+    since the last reset, which concurrent spans would fight over), so a
+    sampler thread records the highest RSS seen while each span is open.
+    """
+    global _sampler_pid
+    key = object()
+    rss = rss_bytes()
+    with _lock:
+        _open_spans[key] = rss
+        # Threads don't survive fork, so each process starts its own sampler
+        if _sampler_pid != os.getpid():
+            _sampler_pid = os.getpid()
+            threading.Thread(target=_sample_rss, daemon=True).start()
+    return key
+
+
+def _close_span(key):
+    """Stop tracking a span and return the peak RSS seen while it was open"""
+    rss = rss_bytes()
+    with _lock:
+        return max(_open_spans.pop(key, 0), rss)
+
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    """Measure a pipeline stage: wall time, CPU time and peak RSS while it ran.
+
+    The span is added to the current job's trace and to this process's stage
+    histograms. CPU time is process-wide, so spans that run concurrently
+    (B-roll downloads) each see their neighbours' CPU too. Spans given a
+    ``cores`` budget also record how much of it was used.
+    """
+    started_at = time.time()
+    start = time.perf_counter()
+    start_cpu = cpu_seconds()
+    rss_key = _open_span()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        peak_rss = _close_span(rss_key)
+        record = {
+            'stage': stage,
+            'started_at': round(started_at, 3),
+            'wall_seconds': round(time.perf_counter() - start, 4),
+            'cpu_seconds': round(cpu_seconds() - start_cpu, 4),
+            'peak_rss_mb': round(peak_rss / 2**20, 1),
+            **attrs,
+        }
+        if attrs.get('cores') and record['wall_seconds'] > 0:
+            record['cpu_utilization'] = round(
+                record['cpu_seconds'] / (record['wall_seconds'] * attrs['cores']), 3)
+        if error:
+            record['error'] = error
+        spans = _trace.get()
+        if spans is not None:
+            spans.append(record)
+        observe(stage, record['wall_seconds'], record['cpu_seconds'], peak_rss)
+
+
+@contextlib.contextmanager
+def trace(job_id):
+    """Collect the spans of one job and log them as a single JSON line.
+
+    Yields the list the spans are appended to.
+    """
+    spans = []
+    token = _trace.set(spans)
+    try:
+        with span('job'):
+            yield spans
+    finally:
+        _trace.reset(token)
+        print(json.dumps({'event': 'job_spans', 'job_id': job_id, 'spans': spans,
+                          'cpu': cpu_summary(spans)}))
+
+
+def cpu_summary(spans):
+    """A job's CPU use: average cores busy overall, and how much of its core budgets it used.
+
+    A budget utilization well below 1 means the stage budgets could be
+    smaller and more jobs run side by side.
+    """
+    job = next((s for s in reversed(spans) if s['stage'] == 'job'), None)
+    budgeted = [s for s in spans if s.get('cores')]
+    reserved = sum(s['wall_seconds'] * s['cores'] for s in budgeted)
+    summary = {
+        'cores_reserved_seconds': round(reserved, 3),
+        'budget_utilization': round(sum(s['cpu_seconds'] for s in budgeted) / reserved, 3) if reserved else None,
+        'core_wait_seconds': round(sum(s['wall_seconds'] for s in spans if s['stage'] == 'core_wait'), 3),
+    }
+    if job and job['wall_seconds'] > 0:
+        summary['average_cores'] = round(job['cpu_seconds'] / job['wall_seconds'], 3)
+    return summary
+
+
+def in_context(fn):
+    """Wrap fn so it runs in the caller's context, e.g. on a thread pool"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def observe(stage, wall_seconds, cpu, peak_rss):
+    global _metrics_path
+    with _lock:
+        stats = _stages.setdefault(stage, {
+            'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0, 'cpu': 0.0, 'peak_rss': 0,
+        })
+        for i, bound in enumerate(BUCKETS):
+            if wall_seconds <= bound:
+                stats['buckets'][i] += 1
+        stats['count'] += 1
+        stats['sum'] += wall_seconds
+        stats['cpu'] += cpu
+        stats['peak_rss'] = max(stats['peak_rss'], peak_rss)
+        if _metrics_path is None:
+            # The random suffix keeps a reused pid from overwriting a dead process's totals
+            _metrics_path = os.path.join(METRICS_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        data = json.dumps(_stages)
+        path = _metrics_path
+
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write metrics: {e}")
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(totals, stages):
+    for stage, stats in stages.items():
+        # Files written with different buckets can't be added up
+        if len(stats['buckets']) != len(BUCKETS):
+            continue
+        total = totals.setdefault(stage, {
+            'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0, 'cpu': 0.0, 'peak_rss': 0,
+        })
+        total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+        total['count'] += stats['count']
+        total['sum'] += stats['sum']
+        total['cpu'] += stats['cpu']
+        total['peak_rss'] = max(total['peak_rss'], stats['peak_rss'])
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _fold_dead(paths):
+    """Add the files of exited processes to the totals file and remove them.
+
+    Every job's pool process leaves a file behind, so without this the
+    directory (and the time to read it) would grow for as long as the host
+    runs. Returns the paths that are left.
+    """
+    dead = []
+    for path in paths:
+        pid = os.path.basename(path).split('-', 1)[0]
+        if pid.isdigit() and not _is_alive(int(pid)):
+            dead.append(path)
+    if not dead:
+        return paths
+
+    totals_path = os.path.join(METRICS_DIR, TOTALS_FILE)
+    totals = _load(totals_path) or {}
+    for path in dead:
+        _add(totals, _load(path) or {})
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(totals, f)
+    os.replace(tmp_path, totals_path)
+    for path in dead:
+        os.remove(path)
+    return [path for path in paths if path not in dead]
+
+
+def collect():
+    """Sum the stage metrics written by every process, past and present"""
+    totals = {}
+    if not os.path.isdir(METRICS_DIR):
+        return totals
+    # Folding and reading under one lock so no file is counted twice or missed
+    with open(os.path.join(METRICS_DIR, '.collect.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        paths = glob.glob(os.path.join(METRICS_DIR, '*-*.json'))
+        try:
+            paths = _fold_dead(paths)
+        except OSError as e:
+            print(f"Could not fold metrics of exited processes: {e}")
+        for path in paths + [os.path.join(METRICS_DIR, TOTALS_FILE)]:
+            _add(totals, _load(path) or {})
+    return totals
+
+
+def render_prometheus(gauges=None):
+    """Stage histograms plus the given {name: (help, value)} gauges in Prometheus text format"""
+    stages = collect()
+    lines = [
+        '# HELP video_stage_duration_seconds Wall time of pipeline stages',
+        '# TYPE video_stage_duration_seconds histogram',
+    ]
+    for stage, stats in sorted(stages.items()):
+        # Buckets were counted per bound already, so they are cumulative
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append(f'video_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'video_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+        lines.append(f'video_stage_duration_seconds_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+        lines.append(f'video_stage_duration_seconds_count{{stage="{stage}"}} {stats["count"]}')
+
+    lines += [
+        '# HELP video_stage_cpu_seconds_total CPU time spent in pipeline stages',
+        '# TYPE video_stage_cpu_seconds_total counter',
+    ]
+    for stage, stats in sorted(stages.items()):
+        lines.append(f'video_stage_cpu_seconds_total{{stage="{stage}"}} {stats["cpu"]:.6f}')
+
+    lines += [
+        '# HELP video_stage_peak_rss_bytes Highest resident memory seen while a stage ran',
+        '# TYPE video_stage_peak_rss_bytes gauge',
+    ]
+    for stage, stats in sorted(stages.items()):
+        lines.append(f'video_stage_peak_rss_bytes{{stage="{stage}"}} {stats["peak_rss"]}')
+
+    for name, (help_text, value) in (gauges or {}).items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import whisper
+
+# Configure settings from environment variables with defaults
+WHISPER_MODEL = os.environ.get('WHISPER_MODEL', 'base')
+# Maximum number of Whisper model sizes kept in memory at once
+WHISPER_MAX_MODELS = int(os.environ.get('WHISPER_MAX_MODELS', 2))
+# Comma separated list of models to load at worker startup (e.g. "base,small")
+WHISPER_PRELOAD = os.environ.get('WHISPER_PRELOAD', WHISPER_MODEL)
+# CPU inference mode for model names without one: 'fp32' or 'int8'
+WHISPER_QUANTIZE = os.environ.get('WHISPER_QUANTIZE', 'fp32')
+# Intra-op threads torch uses for transcription (0 keeps torch's default);
+# set it to the cores each job worker should get
+WHISPER_THREADS = int(os.environ.get('WHISPER_THREADS', 0))
+QUANTIZE_MODES = ('fp32', 'int8')
+
+# Loaded models, most recently used last
+_models = OrderedDict()
+# Models registered in-process (e.g. stand-ins for benchmarks); never evicted
+_registered = {}
+_load_times = {}
+_lock = threading.Lock()
+
+
+def resolve_name(name=None):
+    """Canonical name of a model: '<size>' for fp32 and '<size>:<mode>' otherwise.
+
+    Names may carry an inference mode ('base:int8'); bare names get
+    WHISPER_QUANTIZE. The canonical name keys loaded models and cached
+    transcripts.
+    """
+    name = name or WHISPER_MODEL
+    if name in _registered:
+        return name
+    size, _, mode = name.partition(':')
+    mode = mode or WHISPER_QUANTIZE
+    return size if mode == 'fp32' else f"{size}:{mode}"
+
+
+def is_available(name):
+    """Check whether a Whisper model name can be loaded"""
+    if name in _registered:
+        return True
+    size, _, mode = name.partition(':')
+    return size in whisper.available_models() and (mode or WHISPER_QUANTIZE) in QUANTIZE_MODES
+
+
+def quantize_int8(model):
+    """Dynamically quantize a CPU model's linear layers to int8.
+
+    Whisper's layers are a Linear subclass that casts weights on every call,
+    and quantize_dynamic only replaces exact nn.Linear modules, so they are
+    turned back into plain nn.Linear first. That is safe in fp32 on CPU,
+    where the cast does nothing.
+    """
+    import torch
+    from whisper.model import Linear
+
+    for module in model.modules():
+        if isinstance(module, Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def set_threads(threads=None):
+    """Pin torch's intra-op threads to threads (default WHISPER_THREADS), if set"""
+    threads = threads or WHISPER_THREADS
+    if threads > 0:
+        import torch
+        if torch.get_num_threads() != threads:
+            torch.set_num_threads(threads)
+
+
+def register_model(name, model):
+    """Make a ready-made model available under a name.
+
+    The model must provide ``transcribe(audio, **options)`` and ``device``
+    like a Whisper model. Registered names take precedence over Whisper's.
+    """
+    with _lock:
+        _registered[name] = model
+        _models.pop(name, None)
+
+
+def get_model(name=None):
+    """Return a loaded Whisper model, loading it on first use"""
+    name = name or WHISPER_MODEL
+    if not is_available(name):
+        raise ValueError(f"Unknown Whisper model '{name}'. Available: {', '.join(whisper.available_models())}"
+                         f" with an optional :{'/:'.join(QUANTIZE_MODES)} suffix")
+    name = resolve_name(name)
+
+    with _lock:
+        if name in _registered:
+            return _registered[name]
+        if name in _models:
+            _models.move_to_end(name)
+            return _models[name]
+
+        print(f"Loading Whisper model '{name}'...")
+        start = time.perf_counter()
+        size, _, mode = name.partition(':')
+        if mode == 'int8':
+            # Quantized kernels are CPU-only
+            model = quantize_int8(whisper.load_model(size, device='cpu'))
+        else:
+            model = whisper.load_model(size)
+        _load_times[name] = time.perf_counter() - start
+        print(f"Loaded Whisper model '{name}' in {_load_times[name]:.2f}s")
+
+        _models[name] = model
+        # Evict least recently used models over the limit
+        while len(_models) > max(WHISPER_MAX_MODELS, 1):
+            evicted, _ = _models.popitem(last=False)
+            print(f"Evicted Whisper model '{evicted}' from memory")
+        return model
+
+
+def preload_models(names=None):
+    """Load models up front so forked workers share the weights copy-on-write"""
+    if names is None:
+        names = [n.strip() for n in WHISPER_PRELOAD.split(',') if n.strip()]
+    for name in names:
+        try:
+            get_model(name)
+        except Exception as e:
+            print(f"Warning: Could not preload Whisper model '{name}': {e}")
+
+
+def model_status():
+    """Describe which models are warm and how long they took to load"""
+    with _lock:
+        return {
+            'default': WHISPER_MODEL,
+            'max_models': WHISPER_MAX_MODELS,
+            'quantize': WHISPER_QUANTIZE,
+            'threads': WHISPER_THREADS,
+            'loaded': [
+                {'name': name, 'load_seconds': round(_load_times.get(name, 0.0), 3)}
+                for name in _models
+            ],
+            'registered': sorted(_registered),
+        }
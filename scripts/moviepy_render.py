@@ -0,0 +1,67 @@
+import functools
+
+from moviepy.editor import ImageClip
+from proglog import TqdmProgressBarLogger
+
+from captions import render_caption
+from render_profiles import moviepy_params
+from timeline import TimelineClip
+
+
+class RenderProgressLogger(TqdmProgressBarLogger):
+    """Forward MoviePy's frame progress to a progress callback"""
+
+    def __init__(self, progress):
+        super().__init__()
+        self.progress = progress
+        self.last_percent = -1
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        super().bars_callback(bar, attr, value, old_value)
+        if bar != 't' or attr != 'index':
+            return
+        total = self.bars[bar].get('total') or 0
+        percent = int(100 * value / total) if total else 0
+        # Only report whole percent changes to keep status updates cheap
+        if percent != self.last_percent:
+            self.last_percent = percent
+            self.progress('rendering', percent / 100)
+
+
+def make_caption_clip(text, start, end):
+    """Build the styled caption clip for one chunk"""
+    # Rendered in-process with Pillow; the RGBA alpha becomes the clip mask
+    return (ImageClip(render_caption(text))
+            .set_position(("center", "bottom"))
+            .set_start(start)
+            .set_duration(end - start))
+
+
+def make_broll_clip(image, start, end):
+    """Build a b-roll clip from an image already scaled to its overlay size"""
+    return (ImageClip(image)
+            .set_position(("center", "top"))
+            .set_start(start)
+            .set_duration(end - start))
+
+
+def build_overlays(caption_chunks, brolls):
+    """Timeline overlays for captions and b-roll, built lazily when on screen"""
+    overlays = []
+    for text, start, end in caption_chunks:
+        overlays.append((start, end, functools.partial(make_caption_clip, text, start, end)))
+    for image, start, end in brolls:
+        overlays.append((start, end, functools.partial(make_broll_clip, image, start, end)))
+    return overlays
+
+
+def render_moviepy(video, output_path, caption_chunks, brolls, progress=None, audio=True, profile=None,
+                   threads=None):
+    """Composite captions and B-roll over the video frame by frame with MoviePy.
+
+    ``profile`` names the render profile for the encoder settings.
+    """
+    final = TimelineClip(video, build_overlays(caption_chunks, brolls))
+    logger = RenderProgressLogger(progress) if progress else 'bar'
+    final.write_videofile(output_path, fps=video.fps, audio=audio, logger=logger,
+                          **moviepy_params(profile, threads))
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import broll
+from captions import CAPTION_FONT
+from disk_cache import DiskCache
+from model_registry import resolve_name
+from render_profiles import RENDER_PROFILE
+from subtitles import CAPTION_STYLE
+
+# Configure settings from environment variables with defaults
+# Finished outputs, keyed by input hash and settings, for re-downloads and repeats
+OUTPUT_STORE_DIR = os.environ.get('OUTPUT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'output-store'))
+OUTPUT_STORE_MAX_MB = int(os.environ.get('OUTPUT_STORE_MAX_MB', 5120))
+# Bump when a pipeline change makes stored outputs stale
+OUTPUT_STORE_VERSION = 1
+
+store = DiskCache(OUTPUT_STORE_DIR, OUTPUT_STORE_MAX_MB * 1024 * 1024)
+
+
+def output_id(input_digest, options):
+    """Id of the output for an input hash and processing options.
+
+    Options that don't change the result (how many segments render in
+    parallel) are left out, and defaults are resolved, so equivalent
+    requests share one output. Server settings that change what is drawn
+    (b-roll count and spacing, captions' font and style) are part of the id.
+    """
+    settings = {
+        'version': OUTPUT_STORE_VERSION,
+        'input': input_digest,
+        'model': resolve_name(options.get('model_name')),
+        'captions_only': bool(options.get('captions_only')),
+    }
+    if not settings['captions_only']:
+        settings['backend'] = options.get('render_backend') or os.environ.get('RENDER_BACKEND', 'moviepy')
+        settings['profile'] = options.get('render_profile') or RENDER_PROFILE
+        settings['captions'] = {'font': CAPTION_FONT, 'style': CAPTION_STYLE}
+        settings['brolls'] = {
+            'enabled': bool(broll.API_KEY),
+            'max': broll.MAX_BROLLS,
+            'every': broll.BROLL_EVERY,
+        }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def is_output_id(value):
+    return len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def get_output(output_id):
+    """Path of a stored output, or None"""
+    return store.get_path(output_id)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _remember_digest(output_id, path, digest):
+    st = os.stat(path)
+    store.put_json(f"digest:{output_id}", {'digest': digest, 'inode': st.st_ino, 'size': st.st_size})
+
+
+def put_output(output_id, path):
+    """Move a finished output into the store and return its stored path"""
+    digest = file_digest(path)
+    stored_path = store.put_file(output_id, path)
+    _remember_digest(output_id, stored_path, digest)
+    return stored_path
+
+
+def output_etag(output_id, path):
+    """ETag for the bytes of a stored output.
+
+    An evicted output can be rendered again under the same id with
+    different bytes (fresh Pexels results), so the id can't be the ETag.
+    The digest recorded by put_output is used while it still describes the
+    file at path, and recomputed otherwise.
+    """
+    st = os.stat(path)
+    entry = store.get_json(f"digest:{output_id}", count=False)
+    if entry and entry.get('inode') == st.st_ino and entry.get('size') == st.st_size:
+        return entry['digest']
+    digest = file_digest(path)
+    _remember_digest(output_id, path, digest)
+    return digest
+
+
+def cache_stats():
+    return store.stats()
@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from moviepy.editor import VideoFileClip
+
+from ffmpeg_render import FFPROBE_BINARY, mux_audio
+from moviepy_render import render_moviepy
+
+# Configure settings from environment variables with defaults
+# Number of time ranges rendered in parallel (1 disables segment rendering)
+RENDER_SEGMENTS = int(os.environ.get('RENDER_SEGMENTS', os.cpu_count() or 1))
+# Videos shorter than this (in seconds) are rendered in one piece
+RENDER_SEGMENT_MIN_SECONDS = float(os.environ.get('RENDER_SEGMENT_MIN_SECONDS', 30))
+
+
+def keyframe_times(input_path):
+    """Return the timestamps of the source video's keyframes.
+
+    Reads packet flags only, so nothing is decoded.
+    """
+    cmd = [
+        FFPROBE_BINARY, '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0',
+        input_path,
+    ]
+    output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            times.append(float(pts_time))
+    return sorted(times)
+
+
+def plan_segments(duration, keyframes, count):
+    """Split [0, duration) into up to count ranges cut at source keyframes.
+
+    Cutting on keyframes keeps each worker's seek cheap and exact. Ranges
+    collapse when several targets snap to the same keyframe.
+    """
+    cuts = {0.0, duration}
+    for i in range(1, count):
+        target = duration * i / count
+        if keyframes:
+            target = min(keyframes, key=lambda k: abs(k - target))
+        if 0 < target < duration:
+            cuts.add(target)
+    cuts = sorted(cuts)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def overlays_in_range(items, start, end):
+    """Items (x, item_start, item_end) overlapping [start, end), shifted to start at 0"""
+    return [(x, item_start - start, item_end - start)
+            for x, item_start, item_end in items
+            if item_start < end and item_end > start]
+
+
+def _render_segment(input_path, part_path, start, end, caption_chunks, brolls, profile, threads):
+    video = VideoFileClip(input_path, audio=False).subclip(start, end)
+    try:
+        render_moviepy(video, part_path, caption_chunks, brolls, audio=False, profile=profile, threads=threads)
+    finally:
+        video.close()
+    return part_path
+
+
+def concat_parts(part_paths, input_path, output_path, profile=None):
+    """Join rendered parts without re-encoding and mux the source audio once"""
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        for path in part_paths:
+            f.write("file '" + path.replace("'", r"'\''") + "'\n")
+        list_path = f.name
+    try:
+        mux_audio(list_path, input_path, output_path, profile=profile, concat=True)
+    finally:
+        os.unlink(list_path)
+
+
+def render_ranges(input_path, ranges, part_paths, caption_chunks, brolls, profile=None, cores=None,
+                  progress=None):
+    """Render each (start, end) range of the timeline to its part path in parallel.
+
+    Each range is rendered by its own process with only the captions and
+    b-roll that overlap it, and without audio. ``cores`` (default all of
+    them) are split evenly between the encoders.
+    """
+    cores = cores or os.cpu_count() or 1
+    workers = max(min(len(ranges), cores), 1)
+    threads = max(cores // workers, 1)
+    # Fork so workers inherit imported modules and cached caption fonts
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [
+            pool.submit(_render_segment, input_path, part_path, start, end,
+                        overlays_in_range(caption_chunks, start, end),
+                        overlays_in_range(brolls, start, end), profile, threads)
+            for part_path, (start, end) in zip(part_paths, ranges)
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            if progress:
+                progress('rendering', done / len(futures))
+
+
+def render_segments(input_path, output_path, caption_chunks, brolls, duration,
+                    segments=RENDER_SEGMENTS, profile=None, cores=None, progress=None):
+    """Render time ranges of the timeline in parallel and stitch them together.
+
+    The parts are joined with ffmpeg's concat demuxer (stream copy) and the
+    original audio is muxed in a single pass at the end.
+    """
+    ranges = plan_segments(duration, keyframe_times(input_path), segments)
+    print(f"Rendering {len(ranges)} segments in parallel")
+
+    work_dir = tempfile.mkdtemp(prefix='segments-')
+    try:
+        part_paths = [os.path.join(work_dir, f"part-{i:04d}.mp4") for i in range(len(ranges))]
+        render_ranges(input_path, ranges, part_paths, caption_chunks, brolls, profile=profile, cores=cores,
+                      progress=progress)
+        concat_parts(part_paths, input_path, output_path, profile=profile)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def should_render_segments(duration, segments=RENDER_SEGMENTS):
+    return segments > 1 and duration >= RENDER_SEGMENT_MIN_SECONDS
@@ -0,0 +1,203 @@
+import fcntl
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: throttling and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Number of lock files identical requests are coalesced on
+LOCK_STRIPES = 256
+# Never sleep longer than this for a single Retry-After
+MAX_RETRY_AFTER = 30.0
+
+
+class PexelsClient:
+    """HTTP client for Pexels shared by every thread and process of a host.
+
+    State lives in ``state_dir`` under flocks, like DiskCache: a token
+    bucket limits API searches to ``rate`` per second (bursts of ``burst``)
+    across all workers, identical in-flight requests are coalesced on
+    striped lock files, and counters are kept for /health. Throttled (429)
+    and 5xx responses are retried with jittered exponential backoff,
+    honouring Retry-After.
+    """
+
+    def __init__(self, state_dir, rate, burst, max_retries=3, backoff=0.5, timeout=10, pool_size=4):
+        self.state_dir = state_dir
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        os.makedirs(os.path.join(state_dir, 'locks'), exist_ok=True)
+
+    def session(self):
+        """Return this process's keep-alive HTTP session"""
+        with self._session_lock:
+            # Pooled connections must not be shared with a forked parent
+            if self._session is None or self._session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(self.pool_size, 1))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session, self._session_pid = session, os.getpid()
+            return self._session
+
+    @contextmanager
+    def _locked(self, path):
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _state_path(self):
+        return os.path.join(self.state_dir, 'state.json')
+
+    def _read_state(self):
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, state):
+        fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._state_path())
+
+    def count(self, **deltas):
+        with self._locked(os.path.join(self.state_dir, '.lock')):
+            state = self._read_state()
+            counters = state.setdefault('counters', {})
+            for field, delta in deltas.items():
+                counters[field] = counters.get(field, 0) + delta
+            self._write_state(state)
+
+    def acquire(self):
+        """Take a token from the shared bucket, sleeping until one is available"""
+        if self.rate <= 0:
+            return
+        throttled = False
+        while True:
+            with self._locked(os.path.join(self.state_dir, '.lock')):
+                state = self._read_state()
+                now = time.time()
+                tokens = min(state.get('tokens', self.burst) + (now - state.get('updated', now)) * self.rate,
+                             self.burst)
+                if tokens >= 1:
+                    state['tokens'] = tokens - 1
+                    state['updated'] = now
+                    if throttled:
+                        counters = state.setdefault('counters', {})
+                        counters['throttled'] = counters.get('throttled', 0) + 1
+                    self._write_state(state)
+                    return
+                wait = (1 - tokens) / self.rate
+            throttled = True
+            # Wake at slightly different times so waiters don't stampede the lock
+            time.sleep(wait * random.uniform(1.0, 1.2))
+
+    @contextmanager
+    def singleflight(self, key):
+        """Hold the lock for key so only one thread or process fetches it at a time.
+
+        Callers check their cache again once inside: if another worker
+        fetched the value meanwhile, the request is coalesced into theirs.
+        """
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        stripe = int.from_bytes(digest[:2], 'big') % LOCK_STRIPES
+        with self._locked(os.path.join(self.state_dir, 'locks', f"{stripe:03d}.lock")):
+            yield
+
+    def coalesce(self, key, lookup, fetch):
+        """Return lookup() if it has a value, otherwise fetch() under key's lock.
+
+        ``lookup(count=True)`` returns None on a miss; ``fetch`` must store
+        what it fetched where ``lookup`` finds it. The re-check under the
+        lock passes ``count=False`` so each call counts one cache hit or miss.
+        """
+        value = lookup()
+        if value is not None:
+            return value
+        with self.singleflight(key):
+            value = lookup(count=False)
+            if value is not None:
+                self.count(coalesced=1)
+                return value
+            return fetch()
+
+    def get(self, url, rate_limited=False, **kwargs):
+        """GET with retries on throttling and server errors; raises for other failures"""
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            if rate_limited:
+                self.acquire()
+            try:
+                response = self.session().get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    self.count(requests=1, errors=1)
+                    raise
+                self.count(requests=1, retries=1)
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                counts = {'requests': 1}
+                if response.status_code == 429:
+                    counts['rate_limited'] = 1
+                if response.status_code >= 400:
+                    counts['errors'] = 1
+                self.count(**counts)
+                response.raise_for_status()
+                return response
+
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = self._backoff(attempt)
+            print(f"Pexels returned {response.status_code}, retrying in {delay:.1f}s")
+            self.count(requests=1, retries=1, **({'rate_limited': 1} if response.status_code == 429 else {}))
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # Full jitter: anywhere up to the exponential backoff
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return min(max(float(value), 0.0), MAX_RETRY_AFTER)
+        except ValueError:
+            # HTTP dates are allowed too, but Pexels sends seconds
+            return None
+
+    def stats(self):
+        state = self._read_state()
+        counters = state.get('counters', {})
+        return {
+            'requests': counters.get('requests', 0),
+            'coalesced': counters.get('coalesced', 0),
+            'throttled': counters.get('throttled', 0),
+            'rate_limited': counters.get('rate_limited', 0),
+            'retries': counters.get('retries', 0),
+            'errors': counters.get('errors', 0),
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+        }
@@ -0,0 +1,95 @@
+from broll import MAX_BROLLS, is_pexels_image_url
+from render_profiles import PROFILES
+
+# The edit plan format: what analyze() writes, clients edit and render_plan
+# reads. Kept free of the rendering and transcription dependencies.
+PLAN_VERSION = 1
+
+
+class PlanError(ValueError):
+    """Raised for edit plans that are malformed or don't match their source"""
+
+
+def validate_plan(plan):
+    """Raise PlanError unless plan is a well-formed edit plan"""
+    if not isinstance(plan, dict) or plan.get('version') != PLAN_VERSION:
+        raise PlanError(f"Plan must be an object with version {PLAN_VERSION}")
+    source = plan.get('source') or {}
+    for field in ('duration', 'fps', 'width', 'height'):
+        if not isinstance(source.get(field), (int, float)):
+            raise PlanError(f"Plan source is missing '{field}'")
+    profile = (plan.get('settings') or {}).get('render_profile')
+    if profile is not None and profile not in PROFILES:
+        raise PlanError(f"Unknown render profile '{profile}', expected one of {sorted(PROFILES)}")
+
+    ids = set()
+    for kind, required in (('captions', 'text'), ('brolls', 'image_url')):
+        items = plan.get(kind)
+        if not isinstance(items, list):
+            raise PlanError(f"Plan '{kind}' must be a list")
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get(required), str):
+                raise PlanError(f"Every entry in '{kind}' needs a '{required}' string")
+            if item.get('id') in ids or not isinstance(item.get('id'), str):
+                raise PlanError(f"Plan entry ids must be unique strings, got {item.get('id')!r}")
+            ids.add(item['id'])
+            start, end = item.get('start'), item.get('end')
+            # Whisper can give a word no duration, so analyze() may write start == end
+            if not isinstance(start, (int, float)) or not isinstance(end, (int, float)) or not 0 <= start <= end:
+                raise PlanError(f"Plan entry '{item['id']}' needs 0 <= start <= end")
+
+    # Every b-roll is downloaded and composited, so clients can't add more than analyze() would
+    if len(plan['brolls']) > MAX_BROLLS:
+        raise PlanError(f"Plan has {len(plan['brolls'])} b-rolls, at most {MAX_BROLLS} are allowed")
+    for broll in plan['brolls']:
+        # The server downloads these, so only Pexels images are allowed
+        if not is_pexels_image_url(broll['image_url']):
+            raise PlanError(f"B-roll '{broll['id']}' image_url must be a Pexels image")
+        width = broll.get('width')
+        if width is not None and (not isinstance(width, int) or isinstance(width, bool)
+                                  or not 0 < width <= source['width']):
+            raise PlanError(f"B-roll '{broll['id']}' width must be a whole number from 1 to the source width")
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def dirty_ranges(previous_plan, plan):
+    """Time ranges that differ between two plans, or None if nothing can be reused"""
+    if previous_plan.get('source') != plan.get('source') or previous_plan.get('version') != plan.get('version'):
+        return None
+    # Parts encoded with different settings can't be spliced
+    if previous_plan.get('settings', {}).get('render_profile') != plan.get('settings', {}).get('render_profile'):
+        return None
+
+    def items(p):
+        entries = {('caption', c['id']): c for c in p['captions']}
+        entries.update({('broll', b['id']): b for b in p['brolls']})
+        return entries
+
+    old, new = items(previous_plan), items(plan)
+    changed = []
+    for key in old.keys() | new.keys():
+        if old.get(key) != new.get(key):
+            # Both where an item was and where it is now need re-rendering
+            for item in (old.get(key), new.get(key)):
+                if item:
+                    changed.append((item['start'], item['end']))
+    return merge_ranges(changed)
+
+
+def expand_to_keyframes(ranges, keyframes, duration):
+    """Widen ranges outwards to keyframes so the untouched parts can be stream-copied"""
+    expanded = []
+    for start, end in ranges:
+        start = max([k for k in keyframes if k <= start], default=0.0)
+        end = min([k for k in keyframes if k >= end], default=duration)
+        expanded.append((start, min(end, duration)))
+    return merge_ranges(expanded)
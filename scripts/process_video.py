@@ -1,10 +1,7 @@
 import sys
-import whisper
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip, ImageClip
-import tempfile
+from moviepy.editor import VideoFileClip
 import os
-import requests
-import json
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables (continue even if .env file doesn't exist)
@@ -13,166 +10,183 @@ try:
 except Exception as e:
     print(f"Note: Could not load .env file. Using system environment variables.")
 
+from model_registry import get_model, resolve_name, set_threads
+from transcript_cache import audio_fingerprint, transcript_key, get_transcript, put_transcript
+from audio import SAMPLE_RATE, load_audio
+from longform import transcribe
+from ffmpeg_render import render_ffmpeg, mux_audio, mux_soft_subtitles
+from moviepy_render import render_moviepy
+from parallel_render import RENDER_SEGMENTS, render_segments, should_render_segments
+from render_profiles import encoder_args
+from captions import prerender_captions
+from broll import API_KEY, MAX_BROLLS, start_broll_fetch
+from metrics import span
+from core_budget import reserve
+
 # Configure settings from environment variables with defaults
-MAX_BROLLS = int(os.environ.get('MAX_BROLLS', 5))
-API_KEY = os.environ.get('PEXELS_API_KEY')
-WHISPER_MODEL = os.environ.get('WHISPER_MODEL', 'base')
+# Renderer for the final video: 'moviepy' (default) or 'ffmpeg'
+RENDER_BACKEND = os.environ.get('RENDER_BACKEND', 'moviepy')
 
 # Check if Pexels API key is available
 if not API_KEY:
     print("WARNING: PEXELS_API_KEY is not set. B-roll functionality will be limited.")
 
-# Load search terms
-def load_search_terms():
-    try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        terms_path = os.path.join(script_dir, 'search_terms.json')
-        if os.path.exists(terms_path):
-            with open(terms_path, 'r') as f:
-                return json.load(f)
-        else:
-            print(f"Warning: search_terms.json not found at {terms_path}")
-            return {}
-    except Exception as e:
-        print(f"Warning: Could not load search terms JSON: {e}")
-        return {}
-
-SEARCH_TERMS = load_search_terms()
-
-def find_search_term(text):
-    """Find a good search term for a given text"""
-    # Normalize the text
-    text = text.lower().strip()
-    words = text.split()
-    
-    # Look through all categories
-    for category, terms in SEARCH_TERMS.items():
-        for key, value in terms.items():
-            if key.lower() in text:
-                return value
-    
-    # If no match found, return the original text (fallback)
-    return text
-
-def process_video(input_path, output_path):
+def build_caption_chunks(result, words_per_chunk=3):
+    """Group Whisper word timestamps into (text, start, end) caption chunks"""
+    caption_chunks = []
+    for seg in result["segments"]:
+        words = seg.get("words", [])
+        i = 0
+        while i < len(words):
+            chunk = words[i:i+words_per_chunk]
+            if not chunk:
+                break
+            text = " ".join([w["word"] for w in chunk])
+            start = chunk[0]["start"]
+            end = chunk[-1]["end"]
+            caption_chunks.append((text, start, end))
+            i += words_per_chunk
+    return caption_chunks
+
+def transcribe_video(input_path, model_name=None):
+    """Transcribe a video's audio with word timestamps, reusing cached transcripts"""
+    options = {'word_timestamps': True}
+    with span('fingerprint'):
+        fingerprint = audio_fingerprint(input_path)
+    # The canonical name includes the inference mode, so int8 and fp32 results are kept apart
+    key = transcript_key(fingerprint, resolve_name(model_name), options) if fingerprint else None
+    if key:
+        result = get_transcript(key)
+        if result is not None:
+            print("Using cached transcript")
+            return result
+
+    # Extract audio as 16 kHz mono PCM, straight into memory
+    with span('extract_audio'):
+        audio = load_audio(input_path)
+    with span('load_model'):
+        model = get_model(model_name)
+    # A GPU model needs one core to feed it, not a CPU budget
+    with reserve('transcribe', cores=1 if model.device.type != 'cpu' else None) as cores:
+        set_threads(cores)
+        # Long recordings are split at silences and transcribed in parallel
+        with span('transcribe', audio_seconds=round(len(audio) / SAMPLE_RATE, 1), cores=cores):
+            result = transcribe(model, audio, cores=cores, **options)
+    if key:
+        put_transcript(key, result)
+    return result
+
+def overlay_images(brolls):
+    """(image, start, end) tuples for the renderers from fetched b-roll"""
+    return [(b['image'], b['start'], b['end']) for b in brolls]
+
+def render_video(video, input_path, output_path, caption_chunks, brolls, backend=None, segments=None,
+                 profile=None, progress=None):
+    """Render captions and (image, start, end) b-roll with the selected backend.
+
+    ``profile`` names the render profile (default RENDER_PROFILE). The
+    source audio is muxed in afterwards, stream-copied when possible.
+    Encoding waits for the job's core budget and uses that many threads.
+    Returns the backend that rendered the video, which is 'moviepy' when
+    ffmpeg failed and the render fell back to it.
+    """
+    if progress is None:
+        progress = lambda stage, fraction: None
+    progress('rendering', 0.0)
+
+    backend = backend or RENDER_BACKEND
+    if backend == 'ffmpeg':
+        try:
+            with reserve('encode') as cores, span('render', backend='ffmpeg', cores=cores):
+                render_ffmpeg(input_path, output_path, caption_chunks, brolls,
+                              video.size, video.fps, video.duration, progress=progress,
+                              encode_args=encoder_args(profile, threads=cores),
+                              decode_args=['-threads', str(cores)])
+            return 'ffmpeg'
+        except Exception as e:
+            print(f"ffmpeg render failed, falling back to MoviePy: {e}")
+
+    segments = segments or RENDER_SEGMENTS
+    if should_render_segments(video.duration, segments):
+        with reserve('encode') as cores, span('render', backend='moviepy', segments=segments, cores=cores):
+            render_segments(input_path, output_path, caption_chunks, brolls, video.duration,
+                            segments=segments, profile=profile, cores=cores, progress=progress)
+    else:
+        # Encode the frames only; MoviePy would re-encode the untouched audio
+        fd, video_path = tempfile.mkstemp(suffix='.mp4', dir=os.path.dirname(os.path.abspath(output_path)))
+        os.close(fd)
+        try:
+            with reserve('encode') as cores, span('render', backend='moviepy', cores=cores):
+                render_moviepy(video, video_path, caption_chunks, brolls, progress=progress, audio=False,
+                               profile=profile, threads=cores)
+            with span('mux'):
+                mux_audio(video_path, input_path, output_path, profile=profile)
+        finally:
+            os.unlink(video_path)
+    return 'moviepy'
+
+def process_video(input_path, output_path, model_name=None, progress=None, render_backend=None,
+                  segments=None, captions_only=False, render_profile=None):
+    """Caption a video and overlay B-roll.
+
+    ``progress`` is an optional ``progress(stage, fraction)`` callback invoked
+    as the pipeline moves through its stages. ``render_backend`` selects
+    'moviepy' or 'ffmpeg' and defaults to the RENDER_BACKEND setting.
+    ``segments`` is how many time ranges the MoviePy renderer encodes in
+    parallel (default RENDER_SEGMENTS). ``render_profile`` picks the
+    encoder settings (default RENDER_PROFILE). With ``captions_only`` the
+    captions are muxed as a soft subtitle track and the video is not re-encoded.
+
+    Returns ``(output_path, complete)``. ``complete`` is False when the
+    b-roll fetch hit its deadline or failed lookups, so the output lacks
+    b-roll a later run could add and shouldn't be stored for reuse.
+    """
+    if progress is None:
+        progress = lambda stage, fraction: None
 
     try:
-        # Load video
-        video = VideoFileClip(input_path)
+        # Transcribe audio
+        progress('transcribing', 0.0)
+        result = transcribe_video(input_path, model_name)
 
-        # Extract audio
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio:
-            audio_path = temp_audio.name
-            video.audio.write_audiofile(audio_path)
+        # Group words into chunks for lip-synced captions
+        with span('caption_build'):
+            caption_chunks = build_caption_chunks(result)
 
-        # Transcribe audio
-        model = whisper.load_model(WHISPER_MODEL)
-        result = model.transcribe(audio_path, word_timestamps=True)
-        os.unlink(audio_path)
-
-        # Group words into chunks for lip-synced captions (3 words per chunk)
-        caption_chunks = []
-        for seg in result["segments"]:
-            words = seg.get("words", [])
-            i = 0
-            while i < len(words):
-                chunk = words[i:i+3]  # 3 words per chunk
-                if not chunk:
-                    break
-                text = " ".join([w["word"] for w in chunk])
-                start = chunk[0]["start"]
-                end = chunk[-1]["end"]
-                caption_chunks.append((text, start, end))
-                i += 3
-
-
-        # Initialize b-roll counter
-        broll_count = 0
-        clips = [video]
-        temp_files = []
-
-
-        # Add captions for the whole video
-        for text, start, end in caption_chunks:
-            txt_clip = (TextClip(text.strip(), fontsize=50, color='white',
-                        font="Arial-Bold", stroke_color='black', stroke_width=2)
-                        .set_position(("center", "bottom"))
-                        .set_start(start)
-                        .set_duration(end - start))
-            clips.append(txt_clip)
-
-        # Skip b-roll processing if no API key
-        if not API_KEY:
-            print("Skipping b-roll processing because PEXELS_API_KEY is not set")
-        else:
-            # Select a few chunks for b-rolls (every 5th chunk)
-            broll_chunks = caption_chunks[::5]
-            
-            for idx, (text, start, end) in enumerate(broll_chunks, 1):
-                # Add b-roll if under limit
-                if broll_count < MAX_BROLLS:
-                    try:
-                        
-                        # Find appropriate search term
-                        search_term = find_search_term(text)
-                        print(f"🔎 Using search term: '{search_term}'")
-                        
-                        response = requests.get(
-                            "https://api.pexels.com/v1/search",
-                            headers={"Authorization": API_KEY},
-                            params={
-                                "query": search_term,
-                                "per_page": 1,
-                                "orientation": "landscape"
-                            }
-                        )
-                        response.raise_for_status()
-                        
-                        data = response.json()
-                        if data.get('photos'):
-                            image_url = data['photos'][0]['src']['original']
-                            
-                            img_response = requests.get(image_url)
-                            img_response.raise_for_status()
-                            
-                            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
-                                f.write(img_response.content)
-                                temp_img_path = f.name
-                                temp_files.append(temp_img_path)
-                            
-                            img_clip = (ImageClip(temp_img_path)
-                                        .resize(width=video.w//2)
-                                        .set_position(("center", "top"))
-                                        .set_start(start)
-                                        .set_duration(end - start))
-                            
-                            clips.append(img_clip)
-                            broll_count += 1
-                            print(f"Added b-roll {broll_count}/{MAX_BROLLS}")
-                        else:
-                            print("No images found for this chunk")
-                            
-                    except Exception as e:
-                        print(f"Error processing b-roll: {str(e)}")
-                else:
-                    print(f"⏹️ B-roll limit reached ({MAX_BROLLS}), skipping image overlay")
+        if captions_only:
+            # Fast path: subtitle track only, video and audio stream-copied
+            progress('muxing', 0.0)
+            with span('mux'):
+                mux_soft_subtitles(input_path, output_path, caption_chunks, language=result.get('language'))
+            progress('done', 1.0)
+            return output_path, True
+
+        # Load video
+        progress('loading', 0.0)
+        with span('load_video'):
+            video = VideoFileClip(input_path)
+
+        # Fetch b-roll in the background while captions are rasterized
+        progress('broll', 0.0)
+        # B-roll covers half the frame width and is fetched at that size
+        broll_future = start_broll_fetch(caption_chunks, video.w // 2, progress=progress)
+        backend = render_backend or RENDER_BACKEND
+        if backend != 'ffmpeg':
+            with span('caption_render'):
+                prerender_captions(text for text, _, _ in caption_chunks)
+        # Only the part of the fetch not hidden behind caption rendering
+        with span('broll_wait'):
+            brolls, complete = broll_future.result()
 
         # Compose final video
         print("\nRendering final video...")
-        final = CompositeVideoClip(clips)
-        final.write_videofile(output_path, codec="libx264", fps=video.fps)
-
-        # Cleanup
-        print("Cleaning up temporary files...")
-        for file_path in temp_files:
-            try:
-                os.unlink(file_path)
-            except Exception as e:
-                print(f"Error deleting {file_path}: {e}")
-
-        print(f"Total b-rolls added: {broll_count}/{MAX_BROLLS}")
-        
-        return output_path
+        render_video(video, input_path, output_path, caption_chunks, overlay_images(brolls),
+                     backend=backend, segments=segments, profile=render_profile, progress=progress)
+
+        print(f"Total b-rolls added: {len(brolls)}/{MAX_BROLLS}")
+        progress('done', 1.0)
+
+        return output_path, complete
         
     except Exception as e:
         print(f"Critical error during processing: {str(e)}")
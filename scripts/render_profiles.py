@@ -0,0 +1,55 @@
+import os
+
+# Configure settings from environment variables with defaults
+# Encoding profile used when a request doesn't pick one
+RENDER_PROFILE = os.environ.get('RENDER_PROFILE', 'balanced')
+# Encoder threads for a single render (0 lets x264 decide); parallel
+# segment renders split the cores between them instead
+RENDER_THREADS = int(os.environ.get('RENDER_THREADS', 0))
+
+# libx264 settings per profile. Every profile uses the same pixel format so
+# parts rendered with different backends can still be spliced together.
+PROFILES = {
+    'fast': {'preset': 'veryfast', 'crf': 26, 'pix_fmt': 'yuv420p', 'faststart': True},
+    'balanced': {'preset': 'medium', 'crf': 23, 'pix_fmt': 'yuv420p', 'faststart': True},
+    'archival': {'preset': 'slow', 'crf': 18, 'pix_fmt': 'yuv420p', 'faststart': True},
+}
+
+
+def get_profile(name=None):
+    """Return the settings of a render profile, raising ValueError for unknown names"""
+    name = name or RENDER_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown render profile '{name}', expected one of {sorted(PROFILES)}")
+    return PROFILES[name]
+
+
+def encoder_args(name=None, threads=None):
+    """ffmpeg output arguments for the profile's video encoding"""
+    profile = get_profile(name)
+    args = [
+        '-c:v', 'libx264',
+        '-preset', profile['preset'],
+        '-crf', str(profile['crf']),
+        '-pix_fmt', profile['pix_fmt'],
+    ]
+    threads = threads or RENDER_THREADS
+    if threads:
+        args += ['-threads', str(threads)]
+    return args + container_args(name)
+
+
+def container_args(name=None):
+    """Muxer arguments; +faststart moves the index up front for progressive playback"""
+    return ['-movflags', '+faststart'] if get_profile(name)['faststart'] else []
+
+
+def moviepy_params(name=None, threads=None):
+    """Keyword arguments for MoviePy's write_videofile"""
+    profile = get_profile(name)
+    return {
+        'codec': 'libx264',
+        'preset': profile['preset'],
+        'threads': threads or RENDER_THREADS or None,
+        'ffmpeg_params': ['-crf', str(profile['crf']), '-pix_fmt', profile['pix_fmt']],
+    }
@@ -0,0 +1,102 @@
+import json
+import os
+import re
+
+# Load search terms
+def load_search_terms():
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        terms_path = os.path.join(script_dir, 'search_terms.json')
+        if os.path.exists(terms_path):
+            with open(terms_path, 'r') as f:
+                return json.load(f)
+        else:
+            print(f"Warning: search_terms.json not found at {terms_path}")
+            return {}
+    except Exception as e:
+        print(f"Warning: Could not load search terms JSON: {e}")
+        return {}
+
+SEARCH_TERMS = load_search_terms()
+
+# Words are runs of letters/digits, optionally joined by apostrophes ("don't")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchTermIndex:
+    """Phrase hash over every search term key, built once.
+
+    Keys match on whole words only, so "cat" no longer matches inside
+    "education"; a trailing plural "s" is accepted ("cats" matches "cat").
+    When several keys match a text, the longest phrase wins, then the one that
+    appears first in the text, then the one listed first in search_terms.json.
+    Matching costs a dict lookup per word and candidate phrase length, so it
+    does not grow with the size of the vocabulary.
+    """
+
+    def __init__(self, search_terms):
+        # phrase tokens -> (vocabulary order, search term)
+        self.phrases = {}
+        # first token -> phrase lengths starting with it, longest first
+        self.lengths = {}
+
+        order = 0
+        for terms in search_terms.values():
+            for key, value in terms.items():
+                tokens = tuple(tokenize(key))
+                if not tokens:
+                    continue
+                variants = [tokens]
+                if not tokens[-1].endswith('s'):
+                    variants.append(tokens[:-1] + (tokens[-1] + 's',))
+                for variant in variants:
+                    if variant not in self.phrases:
+                        self.phrases[variant] = (order, value)
+                        lengths = self.lengths.setdefault(variant[0], [])
+                        if len(variant) not in lengths:
+                            lengths.append(len(variant))
+                            lengths.sort(reverse=True)
+                order += 1
+
+    def match_tokens(self, tokens):
+        """Return the best search term for a token list, or None"""
+        best = None
+        for position, token in enumerate(tokens):
+            for length in self.lengths.get(token, ()):
+                hit = self.phrases.get(tuple(tokens[position:position + length]))
+                if hit is None:
+                    continue
+                rank = (-length, position, hit[0])
+                if best is None or rank < best[0]:
+                    best = (rank, hit[1])
+                # Shorter phrases at this position can't outrank a longer one
+                break
+        return best[1] if best else None
+
+    def match(self, text):
+        return self.match_tokens(tokenize(text))
+
+    def match_all(self, texts):
+        """Match many texts (e.g. every caption chunk) in one pass"""
+        return [self.match_tokens(tokenize(text)) for text in texts]
+
+
+SEARCH_INDEX = SearchTermIndex(SEARCH_TERMS)
+
+
+def find_search_term(text):
+    """Find a good search term for a given text"""
+    term = SEARCH_INDEX.match(text)
+
+    # If no match found, return the original text (fallback)
+    return term if term is not None else text.lower().strip()
+
+
+def find_search_terms(texts):
+    """Find search terms for many texts at once"""
+    return [term if term is not None else text.lower().strip()
+            for text, term in zip(texts, SEARCH_INDEX.match_all(texts))]
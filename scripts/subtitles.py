@@ -0,0 +1,134 @@
+# Caption style shared by the renderers
+CAPTION_STYLE = {
+    'font': 'Arial',
+    'fontsize': 50,
+    'color': 'white',
+    'stroke_color': 'black',
+    'stroke_width': 2,
+    'bold': True,
+}
+
+# ASS colours are &HAABBGGRR
+ASS_COLORS = {
+    'white': '&H00FFFFFF',
+    'black': '&H00000000',
+    'yellow': '&H0000FFFF',
+}
+
+
+SUBTITLE_FORMATS = {
+    'srt': 'application/x-subrip',
+    'vtt': 'text/vtt',
+    'ass': 'text/x-ssa',
+}
+
+# Whisper reports ISO 639-1 codes (plus a few of its own); MP4 tracks are
+# tagged with ISO 639-2/T. Cantonese has no 639-2 code of its own.
+WHISPER_LANGUAGES = {
+    'af': 'afr', 'am': 'amh', 'ar': 'ara', 'as': 'asm', 'az': 'aze', 'ba': 'bak', 'be': 'bel',
+    'bg': 'bul', 'bn': 'ben', 'bo': 'bod', 'br': 'bre', 'bs': 'bos', 'ca': 'cat', 'cs': 'ces',
+    'cy': 'cym', 'da': 'dan', 'de': 'deu', 'el': 'ell', 'en': 'eng', 'es': 'spa', 'et': 'est',
+    'eu': 'eus', 'fa': 'fas', 'fi': 'fin', 'fo': 'fao', 'fr': 'fra', 'gl': 'glg', 'gu': 'guj',
+    'ha': 'hau', 'haw': 'haw', 'he': 'heb', 'hi': 'hin', 'hr': 'hrv', 'ht': 'hat', 'hu': 'hun',
+    'hy': 'hye', 'id': 'ind', 'is': 'isl', 'it': 'ita', 'ja': 'jpn', 'jw': 'jav', 'ka': 'kat',
+    'kk': 'kaz', 'km': 'khm', 'kn': 'kan', 'ko': 'kor', 'la': 'lat', 'lb': 'ltz', 'ln': 'lin',
+    'lo': 'lao', 'lt': 'lit', 'lv': 'lav', 'mg': 'mlg', 'mi': 'mri', 'mk': 'mkd', 'ml': 'mal',
+    'mn': 'mon', 'mr': 'mar', 'ms': 'msa', 'mt': 'mlt', 'my': 'mya', 'ne': 'nep', 'nl': 'nld',
+    'nn': 'nno', 'no': 'nor', 'oc': 'oci', 'pa': 'pan', 'pl': 'pol', 'ps': 'pus', 'pt': 'por',
+    'ro': 'ron', 'ru': 'rus', 'sa': 'san', 'sd': 'snd', 'si': 'sin', 'sk': 'slk', 'sl': 'slv',
+    'sn': 'sna', 'so': 'som', 'sq': 'sqi', 'sr': 'srp', 'su': 'sun', 'sv': 'swe', 'sw': 'swa',
+    'ta': 'tam', 'te': 'tel', 'tg': 'tgk', 'th': 'tha', 'tk': 'tuk', 'tl': 'tgl', 'tr': 'tur',
+    'tt': 'tat', 'uk': 'ukr', 'ur': 'urd', 'uz': 'uzb', 'vi': 'vie', 'yi': 'yid', 'yo': 'yor',
+    'yue': 'zho', 'zh': 'zho',
+}
+
+
+def subtitle_language(code):
+    """ISO 639-2 tag for a language Whisper detected, 'und' if unknown"""
+    return WHISPER_LANGUAGES.get((code or '').lower(), 'und')
+
+
+def format_srt_time(seconds, separator=','):
+    """Format seconds as an SRT timestamp (HH:MM:SS,mmm)"""
+    milliseconds = int(round(max(seconds, 0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{milliseconds:03d}"
+
+
+def to_srt(caption_chunks):
+    """Build an SRT document for (text, start, end) caption chunks"""
+    cues = []
+    for index, (text, start, end) in enumerate(caption_chunks, 1):
+        cues.append(f"{index}\n{format_srt_time(start)} --> {format_srt_time(end)}\n{text.strip()}\n")
+    return "\n".join(cues)
+
+
+def to_vtt(caption_chunks):
+    """Build a WebVTT document for (text, start, end) caption chunks"""
+    cues = ["WEBVTT\n"]
+    for text, start, end in caption_chunks:
+        # "-->" would end the cue timing line early
+        text = text.strip().replace('-->', '->')
+        cues.append(f"{format_srt_time(start, '.')} --> {format_srt_time(end, '.')}\n{text}\n")
+    return "\n".join(cues)
+
+
+def format_ass_time(seconds):
+    """Format seconds as an ASS timestamp (H:MM:SS.cc)"""
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def escape_ass_text(text):
+    """Make caption text safe for an ASS Dialogue line"""
+    # Braces start override blocks and cannot be escaped in ASS
+    text = text.strip().replace('{', '(').replace('}', ')')
+    return text.replace('\r', '').replace('\n', '\\N')
+
+
+def to_ass(caption_chunks, width, height, style=None):
+    """Build an ASS subtitle document for (text, start, end) caption chunks"""
+    style = dict(CAPTION_STYLE, **(style or {}))
+    primary = ASS_COLORS.get(style['color'], ASS_COLORS['white'])
+    outline = ASS_COLORS.get(style['stroke_color'], ASS_COLORS['black'])
+    bold = -1 if style['bold'] else 0
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        # Alignment 2 is bottom centre, like set_position(("center", "bottom"))
+        f"Style: Caption,{style['font']},{style['fontsize']},{primary},{primary},{outline},&H00000000,"
+        f"{bold},0,0,0,100,100,0,0,1,{style['stroke_width']},0,2,10,10,10,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for text, start, end in caption_chunks:
+        lines.append(f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Caption,,0,0,0,,"
+                     f"{escape_ass_text(text)}")
+    return "\n".join(lines) + "\n"
+
+
+def to_subtitles(caption_chunks, subtitle_format, width=1920, height=1080):
+    """Build a subtitle document in one of SUBTITLE_FORMATS"""
+    if subtitle_format == 'srt':
+        return to_srt(caption_chunks)
+    if subtitle_format == 'vtt':
+        return to_vtt(caption_chunks)
+    if subtitle_format == 'ass':
+        return to_ass(caption_chunks, width, height)
+    raise ValueError(f"Unknown subtitle format '{subtitle_format}'")
@@ -0,0 +1,59 @@
+import math
+
+from moviepy.editor import VideoClip
+
+# Width of the time buckets used to index overlays, in seconds
+BUCKET_SECONDS = 1.0
+
+
+class TimelineClip(VideoClip):
+    """Composite overlays on a base clip, visiting only those active at t.
+
+    ``overlays`` is a list of ``(start, end, factory)`` tuples in layer order,
+    where ``factory()`` builds the positioned clip with its start and duration
+    already set. Overlays are indexed into fixed-width time buckets, so each
+    frame only looks at the few overlays in its bucket instead of scanning the
+    whole timeline the way CompositeVideoClip does. Clips are built the first
+    time they become active and dropped as soon as they are no longer on
+    screen, so memory stays flat however many captions the video has.
+    """
+
+    def __init__(self, base, overlays, bucket_seconds=BUCKET_SECONDS):
+        # VideoClip.__init__ renders frame 0, so the index must exist first
+        self.base = base
+        self.overlays = list(overlays)
+        self.bucket_seconds = bucket_seconds
+        self.buckets = {}
+        self.active = {}
+
+        for index, (start, end, _) in enumerate(self.overlays):
+            first = int(math.floor(start / bucket_seconds))
+            last = int(math.floor(end / bucket_seconds))
+            for bucket in range(first, last + 1):
+                self.buckets.setdefault(bucket, []).append(index)
+
+        super().__init__(make_frame=self.make_timeline_frame, duration=base.duration)
+        self.size = base.size
+        self.fps = getattr(base, 'fps', None)
+        self.audio = base.audio
+
+    def active_indices(self, t):
+        """Indices of overlays on screen at time t, in layer order"""
+        candidates = self.buckets.get(int(math.floor(t / self.bucket_seconds)), [])
+        return [i for i in candidates if self.overlays[i][0] <= t < self.overlays[i][1]]
+
+    def make_timeline_frame(self, t):
+        frame = self.base.get_frame(t)
+        indices = self.active_indices(t)
+
+        # Release clips whose window has ended (or not started, when seeking)
+        for index in list(self.active):
+            if index not in indices:
+                self.active.pop(index).close()
+
+        for index in indices:
+            clip = self.active.get(index)
+            if clip is None:
+                clip = self.active[index] = self.overlays[index][2]()
+            frame = clip.blit_on(frame, t)
+        return frame
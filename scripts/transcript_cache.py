@@ -0,0 +1,95 @@
+import gzip
+import json
+import os
+import subprocess
+import tempfile
+
+from disk_cache import DiskCache
+from ffmpeg_render import FFMPEG_BINARY
+
+# Configure settings from environment variables with defaults
+TRANSCRIPT_CACHE_DIR = os.environ.get('TRANSCRIPT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'transcript-cache'))
+TRANSCRIPT_CACHE_MAX_MB = int(os.environ.get('TRANSCRIPT_CACHE_MAX_MB', 256))
+
+cache = DiskCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)
+
+
+def audio_fingerprint(input_path):
+    """Hash the first audio stream's encoded packets, or None if there is no audio.
+
+    The packets are stream-copied into ffmpeg's hash muxer, so this only
+    demuxes: it is much cheaper than decoding, yet any change to the audio
+    changes the hash while container metadata and the video track don't.
+    """
+    cmd = [
+        FFMPEG_BINARY, '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-i', input_path,
+        '-map', '0:a:0', '-c', 'copy',
+        '-f', 'hash', '-hash', 'sha256', '-',
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    # Output looks like "SHA256=<hex>"
+    _, _, digest = proc.stdout.strip().partition('=')
+    return digest or None
+
+
+def transcript_key(fingerprint, model_name, options):
+    return json.dumps({'audio': fingerprint, 'model': model_name, 'options': options}, sort_keys=True)
+
+
+def compact(result):
+    """Keep only what the caption pipeline needs from a Whisper result"""
+    return {
+        'language': result.get('language'),
+        'segments': [
+            {
+                'start': round(seg['start'], 3),
+                'end': round(seg['end'], 3),
+                'text': seg.get('text', ''),
+                'words': [[w['word'], round(w['start'], 3), round(w['end'], 3)]
+                          for w in seg.get('words', [])],
+            }
+            for seg in result['segments']
+        ],
+    }
+
+
+def expand(data):
+    """Rebuild a Whisper-shaped result from its compact form"""
+    segments = []
+    for index, seg in enumerate(data['segments']):
+        segments.append({
+            'id': index,
+            'start': seg['start'],
+            'end': seg['end'],
+            'text': seg['text'],
+            'words': [{'word': word, 'start': start, 'end': end} for word, start, end in seg['words']],
+        })
+    return {
+        'language': data.get('language'),
+        'text': ''.join(seg['text'] for seg in segments),
+        'segments': segments,
+    }
+
+
+def get_transcript(key):
+    """Return a cached Whisper result, or None"""
+    data = cache.get(key)
+    if data is None:
+        return None
+    try:
+        return expand(json.loads(gzip.decompress(data)))
+    except (OSError, ValueError, KeyError):
+        cache.delete(key)
+        return None
+
+
+def put_transcript(key, result):
+    payload = json.dumps(compact(result), separators=(',', ':')).encode('utf-8')
+    cache.put(key, gzip.compress(payload))
+
+
+def cache_stats():
+    return cache.stats()
@@ -3,6 +3,27 @@ import { createSupabaseServerClient } from '@/lib/supabase';
 import { randomUUID } from 'crypto';
 
 const VIDEO_PROCESSOR_URL = process.env.VIDEO_PROCESSOR_URL || 'http://localhost:8000';
+const JOB_POLL_INTERVAL_MS = 2000;
+const JOB_TIMEOUT_MS = 30 * 60 * 1000;
+
+// Poll a processor job until it finishes, then download its result
+async function waitForJob(jobId: string): Promise<Response> {
+    const deadline = Date.now() + JOB_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+        const statusResponse = await fetch(`${VIDEO_PROCESSOR_URL}/jobs/${jobId}`);
+        const status = await statusResponse.json();
+
+        if (!statusResponse.ok || status.state === 'failed') {
+            throw new Error(status.error || `Job ${jobId} failed`);
+        }
+        if (status.state === 'done') {
+            return fetch(`${VIDEO_PROCESSOR_URL}/jobs/${jobId}/result`);
+        }
+
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+    throw new Error(`Job ${jobId} timed out`);
+}
 
 export async function POST(request: Request) {
     try {
@@ -22,13 +43,26 @@ export async function POST(request: Request) {
             processorFormData.append('broll', broll);
         }
 
-        // Process the video using the deployed processor service
-        console.log(`Sending video to processor at ${VIDEO_PROCESSOR_URL}/process`);
-        const processorResponse = await fetch(`${VIDEO_PROCESSOR_URL}/process`, {
+        // Queue the video on the deployed processor service
+        console.log(`Sending video to processor at ${VIDEO_PROCESSOR_URL}/jobs`);
+        const jobResponse = await fetch(`${VIDEO_PROCESSOR_URL}/jobs`, {
             method: 'POST',
             body: processorFormData,
         });
 
+        if (!jobResponse.ok) {
+            const errorData = await jobResponse.json();
+            console.error('Video processor error:', errorData);
+            return NextResponse.json(
+                { error: 'Video processing failed', details: errorData },
+                { status: jobResponse.status === 429 ? 429 : 500 }
+            );
+        }
+
+        // Poll the job instead of holding one connection open for the whole render
+        const { id: jobId } = await jobResponse.json();
+        const processorResponse = await waitForJob(jobId);
+
         if (!processorResponse.ok) {
             const errorData = await processorResponse.json();
             console.error('Video processor error:', errorData);
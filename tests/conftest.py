@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pipeline modules import each other by top-level name, as api_server does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
@@ -0,0 +1,56 @@
+import numpy as np
+
+from longform import FRAME_SECONDS, shift_segments, split_at_silence
+
+RATE = 1000
+
+
+def speech_with_gaps(seconds, gaps):
+    """Noise standing in for speech, silent during each (start, end) gap in seconds"""
+    rng = np.random.default_rng(0)
+    audio = rng.uniform(-0.5, 0.5, int(seconds * RATE)).astype(np.float32)
+    for start, end in gaps:
+        audio[int(start * RATE):int(end * RATE)] = 0
+    return audio
+
+
+def test_short_audio_is_one_piece():
+    audio = speech_with_gaps(50, [])
+    assert split_at_silence(audio, RATE, piece_seconds=40, search_seconds=10) == [(0, len(audio))]
+
+
+def test_empty_audio_is_one_piece():
+    audio = np.zeros(5, dtype=np.float32)
+    assert split_at_silence(audio, RATE) == [(0, 5)]
+
+
+def test_pieces_cover_the_audio_contiguously():
+    audio = speech_with_gaps(300, [(38, 41), (81, 83), (125, 127)])
+    pieces = split_at_silence(audio, RATE, piece_seconds=40, search_seconds=10)
+    assert pieces[0][0] == 0
+    assert pieces[-1][1] == len(audio)
+    for (_, end), (start, _) in zip(pieces, pieces[1:]):
+        assert end == start
+    assert all(end > start for start, end in pieces)
+
+
+def test_cuts_land_in_silence():
+    gaps = [(38, 41), (81, 83), (125, 127)]
+    audio = speech_with_gaps(160, gaps)
+    pieces = split_at_silence(audio, RATE, piece_seconds=40, search_seconds=10)
+    cuts = [start / RATE for start, _ in pieces[1:]]
+    assert len(cuts) == len(gaps)
+    # Energy is smoothed, so allow a frame either side of each gap
+    slack = FRAME_SECONDS
+    for cut, (start, end) in zip(cuts, gaps):
+        assert start - slack <= cut <= end + slack
+
+
+def test_shift_segments_moves_segments_and_words():
+    segments = [{
+        'start': 1.0, 'end': 2.0,
+        'words': [{'word': 'hi', 'start': 1.0, 'end': 1.5}, {'word': 'there', 'start': 1.5, 'end': 2.0}],
+    }, {'start': 3.0, 'end': 4.0}]
+    shifted = shift_segments(segments, 120.0)
+    assert [(s['start'], s['end']) for s in shifted] == [(121.0, 122.0), (123.0, 124.0)]
+    assert [(w['start'], w['end']) for w in shifted[0]['words']] == [(121.0, 121.5), (121.5, 122.0)]
@@ -0,0 +1,153 @@
+import copy
+
+import pytest
+
+from broll import MAX_BROLLS
+from plan_format import (PLAN_VERSION, PlanError, dirty_ranges, expand_to_keyframes, merge_ranges,
+                         validate_plan)
+
+IMAGE_URL = 'https://images.pexels.com/photos/123/pexels-photo-123.jpeg?w=940'
+
+
+def make_plan():
+    return {
+        'version': PLAN_VERSION,
+        'source': {'duration': 30.0, 'fps': 25, 'width': 1280, 'height': 720},
+        'settings': {'model_name': 'base', 'render_profile': 'balanced'},
+        'captions': [
+            {'id': 'c0', 'text': 'hello there', 'start': 0.0, 'end': 1.2},
+            {'id': 'c1', 'text': 'general', 'start': 5.0, 'end': 6.0},
+            {'id': 'c2', 'text': 'kenobi', 'start': 20.0, 'end': 21.5},
+        ],
+        'brolls': [
+            {'id': 'b0', 'search_term': 'desert', 'image_url': IMAGE_URL, 'width': 640,
+             'start': 10.0, 'end': 12.0},
+        ],
+    }
+
+
+def test_valid_plan_passes():
+    validate_plan(make_plan())
+
+
+def test_zero_length_entries_pass():
+    # Whisper words can have start == end, and analyze() rounds to milliseconds
+    plan = make_plan()
+    plan['captions'][1].update(start=1.0, end=1.0)
+    validate_plan(plan)
+
+
+@pytest.mark.parametrize('edit', [
+    lambda p: p['captions'][0].update(start=2.0, end=1.0),
+    lambda p: p['captions'][0].update(start=-1.0),
+    lambda p: p['captions'][0].update(end='soon'),
+    lambda p: p['captions'][1].update(id='c0'),
+    lambda p: p['captions'][0].pop('text'),
+    lambda p: p['settings'].update(render_profile='lossless'),
+    lambda p: p['source'].pop('fps'),
+    lambda p: p.update(version=PLAN_VERSION + 1),
+    lambda p: p.update(brolls={}),
+])
+def test_malformed_plans_are_rejected(edit):
+    plan = make_plan()
+    edit(plan)
+    with pytest.raises(PlanError):
+        validate_plan(plan)
+
+
+def test_non_object_plan_is_rejected():
+    with pytest.raises(PlanError):
+        validate_plan([make_plan()])
+
+
+@pytest.mark.parametrize('url', [
+    'http://169.254.169.254/latest/meta-data',
+    'http://10.0.0.5/internal',
+    'file:///etc/passwd',
+    'https://images.pexels.com.example.com/photo.jpg',
+])
+def test_broll_urls_must_be_pexels_images(url):
+    plan = make_plan()
+    plan['brolls'][0]['image_url'] = url
+    with pytest.raises(PlanError):
+        validate_plan(plan)
+
+
+@pytest.mark.parametrize('width', ['huge', 0, -5, 1281, 10 ** 9, 640.5, True])
+def test_broll_width_is_bounded(width):
+    plan = make_plan()
+    plan['brolls'][0]['width'] = width
+    with pytest.raises(PlanError):
+        validate_plan(plan)
+
+
+def test_broll_count_is_bounded():
+    plan = make_plan()
+    broll = plan['brolls'][0]
+    plan['brolls'] = [dict(broll, id=f"b{i}") for i in range(MAX_BROLLS)]
+    validate_plan(plan)
+    plan['brolls'].append(dict(broll, id='extra'))
+    with pytest.raises(PlanError):
+        validate_plan(plan)
+
+
+def test_merge_ranges_joins_overlapping_and_touching():
+    assert merge_ranges([(5, 6), (0, 1), (0.5, 2), (2, 3), (8, 9)]) == [(0, 3), (5, 6), (8, 9)]
+    assert merge_ranges([]) == []
+
+
+def test_unchanged_plan_has_no_dirty_ranges():
+    plan = make_plan()
+    assert dirty_ranges(plan, copy.deepcopy(plan)) == []
+
+
+def test_edited_caption_is_dirty():
+    plan = make_plan()
+    edited = copy.deepcopy(plan)
+    edited['captions'][1]['text'] = 'GENERAL'
+    assert dirty_ranges(plan, edited) == [(5.0, 6.0)]
+
+
+def test_moved_item_dirties_old_and_new_ranges():
+    plan = make_plan()
+    edited = copy.deepcopy(plan)
+    edited['brolls'][0].update(start=25.0, end=27.0)
+    assert dirty_ranges(plan, edited) == [(10.0, 12.0), (25.0, 27.0)]
+
+
+def test_added_and_removed_items_are_dirty():
+    plan = make_plan()
+    edited = copy.deepcopy(plan)
+    del edited['captions'][2]
+    edited['captions'].append({'id': 'c3', 'text': 'new', 'start': 5.5, 'end': 7.0})
+    assert dirty_ranges(plan, edited) == [(5.5, 7.0), (20.0, 21.5)]
+
+
+def test_nothing_is_reusable_across_sources_or_profiles():
+    plan = make_plan()
+    other_source = copy.deepcopy(plan)
+    other_source['source']['width'] = 1920
+    assert dirty_ranges(plan, other_source) is None
+
+    other_profile = copy.deepcopy(plan)
+    other_profile['settings']['render_profile'] = 'fast'
+    assert dirty_ranges(plan, other_profile) is None
+
+
+def test_expand_to_keyframes_widens_outwards():
+    keyframes = [0.0, 2.0, 4.0, 6.0, 8.0]
+    assert expand_to_keyframes([(2.5, 3.0)], keyframes, 10.0) == [(2.0, 4.0)]
+    # Ranges already on keyframes stay put
+    assert expand_to_keyframes([(4.0, 6.0)], keyframes, 10.0) == [(4.0, 6.0)]
+
+
+def test_expand_to_keyframes_merges_ranges_that_meet():
+    keyframes = [0.0, 2.0, 4.0, 6.0]
+    assert expand_to_keyframes([(2.5, 3.0), (3.5, 4.5)], keyframes, 10.0) == [(2.0, 6.0)]
+
+
+def test_expand_to_keyframes_runs_to_the_ends_without_keyframes():
+    assert expand_to_keyframes([(8.5, 9.0)], [0.0, 2.0, 4.0, 6.0, 8.0], 10.0) == [(8.0, 10.0)]
+    assert expand_to_keyframes([(1.0, 2.0)], [5.0], 10.0) == [(0.0, 5.0)]
+    # Keyframes past the end are clamped to the duration
+    assert expand_to_keyframes([(9.0, 9.5)], [0.0, 12.0], 10.0) == [(0.0, 10.0)]
@@ -0,0 +1,57 @@
+from search_terms import SearchTermIndex, find_search_term, tokenize
+
+TERMS = {
+    'animals': {
+        'cat': 'cute cat',
+        'dog': 'happy dog',
+        'hot dog': 'hot dog food',
+    },
+    'places': {
+        'new york': 'new york skyline',
+        'park': 'green park',
+        'city': 'city skyline',
+    },
+}
+
+
+def test_tokenize_keeps_apostrophes_inside_words():
+    assert tokenize("Don't STOP, it's 9am!") == ["don't", 'stop', "it's", '9am']
+
+
+def test_matches_whole_words_only():
+    index = SearchTermIndex(TERMS)
+    assert index.match('Education matters') is None
+    assert index.match('my cat sleeps') == 'cute cat'
+
+
+def test_trailing_plural_matches():
+    index = SearchTermIndex(TERMS)
+    assert index.match('Cats everywhere') == 'cute cat'
+    assert index.match('two parks') == 'green park'
+
+
+def test_longest_phrase_wins():
+    index = SearchTermIndex(TERMS)
+    assert index.match('a dog ate a hot dog') == 'hot dog food'
+    assert index.match('flying to New York city') == 'new york skyline'
+
+
+def test_earliest_position_wins_between_equal_lengths():
+    index = SearchTermIndex(TERMS)
+    assert index.match('the park near the city') == 'green park'
+    assert index.match('the city near the park') == 'city skyline'
+
+
+def test_vocabulary_order_breaks_remaining_ties():
+    index = SearchTermIndex({'a': {'cat': 'first'}, 'b': {'cats': 'second'}})
+    # "cats" is both the plural of the first key and the second key itself
+    assert index.match('cats') == 'first'
+
+
+def test_match_all_matches_each_text():
+    index = SearchTermIndex(TERMS)
+    assert index.match_all(['a dog', 'nothing here', '']) == ['happy dog', None, None]
+
+
+def test_find_search_term_falls_back_to_the_text():
+    assert find_search_term('  Zyxwv Qwerty ') == 'zyxwv qwerty'
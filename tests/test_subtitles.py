@@ -0,0 +1,12 @@
+from subtitles import subtitle_language
+
+
+def test_whisper_languages_map_to_iso_639_2():
+    assert subtitle_language('en') == 'eng'
+    assert subtitle_language('de') == 'deu'
+    assert subtitle_language('haw') == 'haw'
+
+
+def test_unknown_language_is_undetermined():
+    assert subtitle_language(None) == 'und'
+    assert subtitle_language('xx') == 'und'